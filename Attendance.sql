@@ -67,10 +67,85 @@ CREATE TABLE attendance (
     UNIQUE KEY unique_attendance (student_id, lecture_id)
 );
 
+-- Arrival distribution of each QR window: check-ins per whole minute after the
+-- QR was generated, incremented in the same transaction as the attendance insert
+CREATE TABLE arrival_buckets (
+    lecture_id INT NOT NULL,
+    qr_id INT NOT NULL,
+    minute_offset SMALLINT NOT NULL,
+    arrivals INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (lecture_id, qr_id, minute_offset),
+    FOREIGN KEY (lecture_id) REFERENCES lectures(lecture_id),
+    FOREIGN KEY (qr_id) REFERENCES qr_codes(qr_id)
+);
+
+-- Terms (semesters). Sealing a term moves its lectures, QR codes and attendance
+-- out of the tables above into the *_archive tables below, so everyday queries
+-- only ever work against the current term.
+CREATE TABLE terms (
+    term_id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(50) UNIQUE NOT NULL,
+    start_date DATE NOT NULL,
+    end_date DATE NOT NULL,
+    sealed_at TIMESTAMP NULL DEFAULT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Lectures of sealed terms
+CREATE TABLE lectures_archive (
+    lecture_id INT PRIMARY KEY,
+    term_id INT NOT NULL,
+    course_id INT NOT NULL,
+    date DATE NOT NULL,
+    start_time TIME NOT NULL,
+    end_time TIME NOT NULL,
+    created_at TIMESTAMP NULL,
+    FOREIGN KEY (term_id) REFERENCES terms(term_id)
+);
+
+-- QR codes of sealed terms
+CREATE TABLE qr_codes_archive (
+    qr_id INT PRIMARY KEY,
+    term_id INT NOT NULL,
+    lecture_id INT NOT NULL,
+    token VARCHAR(255) NOT NULL,
+    generated_at TIMESTAMP NULL,
+    expires_at TIMESTAMP NULL,
+    FOREIGN KEY (term_id) REFERENCES terms(term_id)
+);
+
+-- Attendance of sealed terms
+CREATE TABLE attendance_archive (
+    attendance_id INT PRIMARY KEY,
+    term_id INT NOT NULL,
+    student_id INT NOT NULL,
+    lecture_id INT NOT NULL,
+    qr_id INT NOT NULL,
+    timestamp TIMESTAMP NULL,
+    FOREIGN KEY (term_id) REFERENCES terms(term_id),
+    UNIQUE KEY unique_attendance_archive (student_id, lecture_id)
+);
+
+-- Arrival distributions of sealed terms
+CREATE TABLE arrival_buckets_archive (
+    term_id INT NOT NULL,
+    lecture_id INT NOT NULL,
+    qr_id INT NOT NULL,
+    minute_offset SMALLINT NOT NULL,
+    arrivals INT NOT NULL,
+    PRIMARY KEY (lecture_id, qr_id, minute_offset),
+    FOREIGN KEY (term_id) REFERENCES terms(term_id)
+);
+
 -- Indexes for better performance
 CREATE INDEX idx_user_university_id ON users(university_id);
 CREATE INDEX idx_course_lecturer ON courses(lecturer_id);
 CREATE INDEX idx_lecture_course ON lectures(course_id);
 CREATE INDEX idx_qr_lecture ON qr_codes(lecture_id);
 CREATE INDEX idx_attendance_student ON attendance(student_id);
-CREATE INDEX idx_attendance_lecture ON attendance(lecture_id);
\ No newline at end of file
+CREATE INDEX idx_attendance_lecture ON attendance(lecture_id);
+CREATE INDEX idx_lecture_date ON lectures(date);
+CREATE INDEX idx_qr_expires ON qr_codes(expires_at);
+CREATE INDEX idx_lecture_archive_term_course ON lectures_archive(term_id, course_id);
+CREATE INDEX idx_qr_archive_lecture ON qr_codes_archive(lecture_id);
+CREATE INDEX idx_attendance_archive_term_lecture ON attendance_archive(term_id, lecture_id);
\ No newline at end of file
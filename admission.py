@@ -0,0 +1,231 @@
+"""Admission control: per-route-class concurrency limits, queues and rate limits.
+
+Every request is mapped to a route class (check-in, auth, reports, lists).
+Each class has its own concurrency limit and its own bounded wait queue, so
+a burst of bcrypt registrations or a large report export can only occupy its
+own slots and never the ones check-in needs. A request that would have to
+wait longer than its class's latency target is refused straight away with
+503 and a Retry-After hint instead of timing out later. Each user also gets a
+token bucket per class, and draining it returns 429. Callers should key users
+by something the client cannot mint freely (a verified user ID); a second,
+more generous bucket per client address bounds how fast any one address can
+spend fresh keys.
+
+State is per worker process; with several workers the limits apply to each
+of them.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+# Keep at most this many idle per-user token buckets per class
+MAX_BUCKETS = 50000
+
+# Weight of the latest request in the moving average of service time
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class Rejected(Exception):
+    """Request refused before it reached its handler."""
+
+    def __init__(self, status, reason, retry_after):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst, now):
+        self.tokens = float(burst)
+        self.updated = now
+
+
+class RouteClass:
+    """Limits and counters of one route class.
+
+    concurrency  requests of the class handled at the same time
+    queue        requests allowed to wait for a free slot
+    max_wait     latency target in seconds; longer expected waits are refused
+    rate, burst  per-user token bucket (requests per second and bucket size),
+                 or rate None for no per-user limit
+    address_rate, address_burst
+                 the same per client address, sized for a whole campus NAT,
+                 or address_rate None for no per-address limit
+    """
+
+    def __init__(self, name, concurrency, queue, max_wait, rate=None, burst=1,
+                 address_rate=None, address_burst=1):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self.max_wait = max_wait
+        self.rate = rate
+        self.burst = burst
+        self.address_rate = address_rate
+        self.address_burst = address_burst
+
+        self.active = 0
+        self.waiting = 0
+        self.service_time = 0.0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_rate = 0
+        self.rejected_queue = 0
+        self.rejected_latency = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+        self.max_observed_wait = 0.0
+        self.buckets = OrderedDict()
+        self.address_buckets = OrderedDict()
+        self.condition = threading.Condition()
+
+    def expected_wait(self, position):
+        """Estimated seconds until the request at this queue position gets a slot."""
+        return position * self.service_time / self.concurrency
+
+    def stats(self):
+        with self.condition:
+            return {
+                "concurrency": self.concurrency,
+                "queue": self.queue,
+                "max_wait_ms": round(self.max_wait * 1000),
+                "rate_per_second": self.rate,
+                "burst": self.burst,
+                "address_rate_per_second": self.address_rate,
+                "address_burst": self.address_burst,
+                "active": self.active,
+                "waiting": self.waiting,
+                "avg_service_ms": round(self.service_time * 1000, 3),
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "avg_queue_wait_ms": round(self.total_wait * 1000 / self.queued, 3) if self.queued else 0.0,
+                "max_queue_wait_ms": round(self.max_observed_wait * 1000, 3),
+                "rejected": {
+                    "rate_limited": self.rejected_rate,
+                    "queue_full": self.rejected_queue,
+                    "latency_target": self.rejected_latency,
+                    "timed_out": self.timed_out
+                },
+                "tracked_users": len(self.buckets),
+                "tracked_addresses": len(self.address_buckets)
+            }
+
+
+class Ticket:
+    __slots__ = ("route_class", "started")
+
+    def __init__(self, route_class, started):
+        self.route_class = route_class
+        self.started = started
+
+
+class AdmissionController:
+    def __init__(self, classes, endpoints):
+        """classes maps a class name to RouteClass keyword arguments;
+        endpoints maps a view function name to its class name."""
+        self.classes = {name: RouteClass(name, **limits) for name, limits in classes.items()}
+        self.endpoints = dict(endpoints)
+
+    def classify(self, endpoint):
+        if not endpoint:
+            return None
+        # Blueprint endpoints are prefixed with the blueprint name
+        name = self.endpoints.get(endpoint.rsplit(".", 1)[-1])
+        return self.classes.get(name) if name else None
+
+    @staticmethod
+    def _bucket(buckets, key, rate, burst, now):
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(burst, now)
+            while len(buckets) > MAX_BUCKETS:
+                buckets.popitem(last=False)
+        else:
+            buckets.move_to_end(key)
+            bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+        return bucket
+
+    def _take_token(self, route_class, user_key, address, now):
+        limits = []
+        if route_class.address_rate is not None and address is not None:
+            limits.append((self._bucket(route_class.address_buckets, address, route_class.address_rate,
+                                        route_class.address_burst, now), route_class.address_rate))
+        if route_class.rate is not None and user_key is not None:
+            limits.append((self._bucket(route_class.buckets, user_key, route_class.rate,
+                                        route_class.burst, now), route_class.rate))
+        for bucket, rate in limits:
+            if bucket.tokens < 1:
+                route_class.rejected_rate += 1
+                raise Rejected(429, "Too many requests", (1 - bucket.tokens) / rate)
+        # Only spend once every limit has a token, so a refusal costs nothing
+        for bucket, _ in limits:
+            bucket.tokens -= 1
+
+    def admit(self, endpoint, user_key=None, address=None):
+        """Wait for a slot in the endpoint's class; returns a ticket for release(), or None if unclassified.
+
+        Raises Rejected when the user is over their rate or the request would
+        wait longer than the class allows.
+        """
+        route_class = self.classify(endpoint)
+        if route_class is None:
+            return None
+
+        with route_class.condition:
+            now = time.monotonic()
+            self._take_token(route_class, user_key, address, now)
+
+            if route_class.active < route_class.concurrency and not route_class.waiting:
+                route_class.active += 1
+                route_class.admitted += 1
+                return Ticket(route_class, now)
+
+            position = route_class.waiting + 1
+            if position > route_class.queue:
+                route_class.rejected_queue += 1
+                raise Rejected(503, "Server busy", route_class.expected_wait(position) or route_class.max_wait)
+            expected_wait = route_class.expected_wait(position)
+            if expected_wait > route_class.max_wait:
+                route_class.rejected_latency += 1
+                raise Rejected(503, "Server busy", expected_wait)
+
+            route_class.waiting += 1
+            deadline = now + route_class.max_wait
+            try:
+                while route_class.active >= route_class.concurrency:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        route_class.timed_out += 1
+                        raise Rejected(503, "Server busy", route_class.expected_wait(route_class.waiting) or route_class.max_wait)
+                    route_class.condition.wait(remaining)
+            finally:
+                route_class.waiting -= 1
+
+            started = time.monotonic()
+            waited = started - now
+            route_class.active += 1
+            route_class.admitted += 1
+            route_class.queued += 1
+            route_class.total_wait += waited
+            if waited > route_class.max_observed_wait:
+                route_class.max_observed_wait = waited
+            return Ticket(route_class, started)
+
+    def release(self, ticket):
+        route_class = ticket.route_class
+        elapsed = time.monotonic() - ticket.started
+        with route_class.condition:
+            route_class.active -= 1
+            if route_class.service_time:
+                route_class.service_time += SERVICE_TIME_SMOOTHING * (elapsed - route_class.service_time)
+            else:
+                route_class.service_time = elapsed
+            route_class.condition.notify()
+
+    def stats(self):
+        return {name: route_class.stats() for name, route_class in self.classes.items()}
@@ -0,0 +1,99 @@
+"""Per-lecture arrival distributions kept as minute buckets.
+
+Each check-in increments one row of arrival_buckets, keyed by the QR code it
+used and the whole minutes elapsed between the QR being generated and the
+check-in. The lecturer dashboard reads those few rows back instead of
+rescanning attendance.
+"""
+import datetime
+
+# Check-ins this many minutes or more after the QR was generated count as late
+LATE_ARRIVAL_MINUTES = 10
+
+# Share of a window's check-ins used for the turnout time
+TURNOUT_SHARE = 0.9
+
+# Offsets are stored as SMALLINT; anything later lands in the last bucket
+MAX_MINUTE_OFFSET = 24 * 60
+
+
+def parse_timestamp(value):
+    if isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+
+
+def minute_offset(generated_at, arrived_at):
+    """Whole minutes from QR generation to check-in, clamped to the stored range."""
+    seconds = (parse_timestamp(arrived_at) - parse_timestamp(generated_at)).total_seconds()
+    return min(max(int(seconds // 60), 0), MAX_MINUTE_OFFSET)
+
+
+def count_buckets(records, generated_at_by_qr):
+    """Group check-in records into {(lecture_id, qr_id, minute_offset): arrivals}."""
+    counts = {}
+    for record in records:
+        generated_at = generated_at_by_qr.get(record['qr_id'])
+        if generated_at is None:
+            continue
+        key = (record['lecture_id'], record['qr_id'], minute_offset(generated_at, record['timestamp']))
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def summarize_histogram(histogram, late_after=LATE_ARRIVAL_MINUTES):
+    """Totals for a dense list of arrivals per minute."""
+    total = sum(histogram)
+    minutes_to_turnout = None
+    if total:
+        target = total * TURNOUT_SHARE
+        running = 0
+        for minute, arrivals in enumerate(histogram):
+            running += arrivals
+            if running >= target:
+                minutes_to_turnout = minute + 1
+                break
+    return {
+        "arrivals": total,
+        "late": sum(histogram[late_after:]),
+        "minutes_to_90_percent": minutes_to_turnout
+    }
+
+
+def summarize(rows, late_after=LATE_ARRIVAL_MINUTES):
+    """Build the arrivals response from (qr_id, generated_at, expires_at, minute_offset, arrivals) rows.
+
+    Every QR window gets its own histogram, with index i holding the check-ins
+    made in minute i after that QR was generated. The lecture-wide histogram
+    adds the windows up aligned on their generation time.
+    """
+    windows = {}
+    for qr_id, generated_at, expires_at, offset, arrivals in rows:
+        window = windows.get(qr_id)
+        if window is None:
+            window = windows[qr_id] = {
+                "qr_id": qr_id,
+                "generated_at": generated_at,
+                "expires_at": expires_at,
+                "histogram": []
+            }
+        histogram = window["histogram"]
+        if len(histogram) <= offset:
+            histogram.extend([0] * (offset + 1 - len(histogram)))
+        histogram[offset] += arrivals
+
+    combined = []
+    for window in windows.values():
+        histogram = window["histogram"]
+        if len(combined) < len(histogram):
+            combined.extend([0] * (len(histogram) - len(combined)))
+        for minute, arrivals in enumerate(histogram):
+            combined[minute] += arrivals
+        window.update(summarize_histogram(histogram, late_after))
+
+    return dict(
+        summarize_histogram(combined, late_after),
+        late_after_minutes=late_after,
+        histogram=combined,
+        windows=sorted(windows.values(), key=lambda window: window["generated_at"])
+    )
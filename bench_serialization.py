@@ -0,0 +1,95 @@
+"""Micro-benchmark of response serialization for the largest API payloads.
+
+Builds synthetic get_course_attendance and get_lectures responses and reports
+encode time and bytes on the wire for Flask's stock encoder settings (sorted
+keys, pretty-printed under debug=True) against serialization.dumps, raw and
+compressed.
+
+Usage: python bench_serialization.py [--students N] [--lectures N] [--repeat N]
+"""
+import argparse
+import datetime
+import gzip
+import json
+import timeit
+
+import serialization
+
+
+def build_course_attendance(students, lectures):
+    start = datetime.date(2025, 9, 15)
+    dates = sorted({(start + datetime.timedelta(days=7 * (i // 2) + 2 * (i % 2))).isoformat()
+                    for i in range(lectures)}, reverse=True)
+    return {
+        "students": [
+            {
+                "student_id": f"2021{i:05d}",
+                "student_name": f"Student Number {i}",
+                "attendance": {date: (i + j) % 5 != 0 for j, date in enumerate(dates)}
+            }
+            for i in range(students)
+        ],
+        "dates": dates
+    }
+
+
+def build_lectures(lectures):
+    start = datetime.date(2025, 9, 15)
+    rows = []
+    for i in range(lectures):
+        date = start + datetime.timedelta(days=7 * (i // 2) + 2 * (i % 2))
+        rows.append({
+            "lecture_id": 1000 + i,
+            "course_id": 42,
+            "date": date,
+            "start_time": datetime.timedelta(hours=9, minutes=30),
+            "end_time": datetime.timedelta(hours=11, minutes=20),
+            "created_at": datetime.datetime.combine(date, datetime.time(9, 28, 4))
+        })
+    return {"lectures": rows}
+
+
+def flask_default_dumps(obj):
+    # Settings of Flask's DefaultJSONProvider when the app runs with debug=True
+    return json.dumps(obj, default=serialization.default, sort_keys=True, indent=2).encode("utf-8")
+
+
+def flask_compact_dumps(obj):
+    return json.dumps(obj, default=serialization.default, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def bench(name, payload, repeat):
+    encoders = [
+        ("flask default (debug)", flask_default_dumps),
+        ("flask default (compact)", flask_compact_dumps),
+        ("stdlib compact", serialization.stdlib_dumps),
+        ("serialization.dumps", serialization.dumps),
+    ]
+    print(f"\n{name}")
+    print(f"  {'encoder':<26}{'ms/op':>10}{'raw bytes':>12}{'gzip':>10}{'br':>10}")
+    for label, encode in encoders:
+        seconds = min(timeit.repeat(lambda: encode(payload), number=repeat, repeat=3)) / repeat
+        body = encode(payload)
+        gzipped = len(gzip.compress(body, compresslevel=serialization.GZIP_LEVEL))
+        brotlied = (len(serialization.compress(body, "br"))
+                    if serialization.brotli is not None else "n/a")
+        print(f"  {label:<26}{seconds * 1000:>10.3f}{len(body):>12}{gzipped:>10}{brotlied:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=300)
+    parser.add_argument("--lectures", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"orjson: {'yes' if serialization.orjson is not None else 'no'}, "
+          f"brotli: {'yes' if serialization.brotli is not None else 'no'}")
+    bench(f"get_course_attendance ({args.students} students x {args.lectures} lectures)",
+          build_course_attendance(args.students, args.lectures), args.repeat)
+    bench(f"get_lectures ({args.lectures} lectures)",
+          build_lectures(args.lectures), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
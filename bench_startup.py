@@ -0,0 +1,83 @@
+"""Cold-start benchmark of the API server.
+
+Starts fresh interpreters and times each step a new worker goes through
+before it can answer: importing server.py, create_app(), the first request,
+and the first QR render (which pays for the deferred qrcode/PIL import). The
+"eager" rows import qrcode, PIL and bcrypt up front, as server.py used to.
+The database is not touched unless --prewarm is given.
+
+Usage: python bench_startup.py [--runs N] [--prewarm]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+if {eager}:
+    import bcrypt, qrcode, qrcode.image.pil
+imported_heavy = time.perf_counter()
+import server
+imported = time.perf_counter()
+app = server.create_app({{"CHECK_IN_JOURNAL_DIR": {journal_dir!r}, "DB_POOL_PREWARM": {prewarm}, "METRICS_TOKEN": "bench"}})
+created = time.perf_counter()
+assert app.test_client().get("/api/metrics/admission", headers={{"X-Metrics-Token": "bench"}}).status_code == 200
+first_request = time.perf_counter()
+lazy_modules = [name for name in ("qrcode", "PIL", "bcrypt") if name in sys.modules]
+server.render_qr_code("bench")
+first_qr = time.perf_counter()
+app.extensions["attendance"].close()
+print(json.dumps({{
+    "eager imports": imported_heavy - started,
+    "import server": imported - imported_heavy,
+    "create_app": created - imported,
+    "first request": first_request - created,
+    "first QR render": first_qr - first_request,
+    "ready to serve": first_request - started,
+    "loaded before first QR": lazy_modules
+}}))
+"""
+
+
+def run_child(eager, prewarm, journal_dir):
+    code = CHILD.format(eager=eager, prewarm=prewarm, journal_dir=journal_dir)
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=HERE,
+        check=True,
+        capture_output=True,
+        text=True
+    ).stdout
+    # The server prints progress lines; the timings are the last line
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--prewarm", action="store_true", help="open the database pool in create_app")
+    args = parser.parse_args()
+
+    steps = ["eager imports", "import server", "create_app", "first request", "first QR render", "ready to serve"]
+    for label, eager in (("lazy (create_app)", False), ("eager imports", True)):
+        results = []
+        for _ in range(args.runs):
+            with tempfile.TemporaryDirectory() as journal_dir:
+                results.append(run_child(eager, args.prewarm, journal_dir))
+
+        print(f"\n{label}, median of {args.runs} cold starts")
+        for step in steps:
+            values = [result[step] * 1000 for result in results]
+            print(f"  {step:<18}{statistics.median(values):>10.1f} ms  (min {min(values):.1f})")
+        print(f"  loaded before first QR: {', '.join(results[-1]['loaded before first QR']) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
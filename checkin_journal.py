@@ -0,0 +1,474 @@
+"""Write-ahead journal that lets check-ins be acknowledged without waiting on MySQL.
+
+Check-ins are appended to segmented log files and acknowledged once fsynced.
+Appends that arrive while an fsync is running are written and synced together
+(group commit). A background applier maps the journal, replays unapplied
+records in batches through a caller-supplied function, and records how far it
+got in a checkpoint file. After a crash the applier resumes from the checkpoint,
+so records may be applied twice and the apply function has to be idempotent
+(the attendance table's unique_attendance key makes INSERT IGNORE so).
+
+Each worker process claims its own slot directory under the journal root with
+an flock, so a restarted worker picks up and replays whatever a crashed one
+left behind. Every applier also drains slots whose lock nobody holds, which
+covers restarts with fewer workers than before.
+"""
+import fcntl
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+RECORD_HEADER = struct.Struct("<II")  # payload length, crc32 of payload
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+CHECKPOINT_FILE = "applied.checkpoint"
+SLOT_PREFIX = "slot-"
+LOCK_FILE = "lock"
+MAX_SLOTS = 256
+
+
+class JournalError(Exception):
+    pass
+
+
+def _segment_name(index):
+    return f"{SEGMENT_PREFIX}{index:010d}{SEGMENT_SUFFIX}"
+
+
+def _fsync_directory(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _list_segments(directory):
+    names = [name for name in os.listdir(directory)
+             if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)]
+    return sorted(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) for name in names)
+
+
+def _read_checkpoint(directory):
+    try:
+        with open(os.path.join(directory, CHECKPOINT_FILE)) as f:
+            segment, offset = f.read().split()
+            return int(segment), int(offset)
+    except (FileNotFoundError, ValueError):
+        return 0, 0
+
+
+def _write_checkpoint(directory, segment, offset):
+    path = os.path.join(directory, CHECKPOINT_FILE)
+    temporary = path + ".tmp"
+    with open(temporary, "w") as f:
+        f.write(f"{segment} {offset}")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def _scan_records(buffer, start, end):
+    """Yield (offset after record, payload) for every intact record in buffer[start:end]."""
+    offset = start
+    while offset + RECORD_HEADER.size <= end:
+        length, crc = RECORD_HEADER.unpack_from(buffer, offset)
+        payload_start = offset + RECORD_HEADER.size
+        if length == 0 or payload_start + length > end:
+            return
+        payload = bytes(buffer[payload_start:payload_start + length])
+        if zlib.crc32(payload) != crc:
+            return
+        offset = payload_start + length
+        yield offset, payload
+
+
+def _unapplied_records(directory):
+    """Yield (segment, offset after record, payload) for every record past the slot's checkpoint."""
+    start_segment, start_offset = _read_checkpoint(directory)
+    for index in _list_segments(directory):
+        if index < start_segment:
+            continue
+        path = os.path.join(directory, _segment_name(index))
+        size = os.path.getsize(path)
+        begin = start_offset if index == start_segment else 0
+        if size <= begin:
+            continue
+        # A torn tail simply ends the scan of that segment
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            for offset, payload in _scan_records(buffer, begin, size):
+                yield index, offset, payload
+
+
+def pending_records(root):
+    """Count check-ins journaled under root but not applied yet, in every slot.
+
+    Reads without claiming any slot, so it can run next to live workers (for
+    example from a CLI command) and only gives a snapshot.
+    """
+    if not os.path.isdir(root):
+        return 0
+    count = 0
+    for name in os.listdir(root):
+        directory = os.path.join(root, name)
+        if not name.startswith(SLOT_PREFIX) or not os.path.isdir(directory):
+            continue
+        try:
+            count += sum(1 for _ in _unapplied_records(directory))
+        except FileNotFoundError:
+            # The slot's applier removed a segment while it was being read; count again
+            return pending_records(root)
+    return count
+
+
+class CheckInJournal:
+    def __init__(self, root, apply_batch, segment_size=4 * 1024 * 1024, batch_size=500,
+                 apply_interval=0.05, max_retry_interval=5.0, abandoned_scan_interval=30.0):
+        self.apply_batch = apply_batch
+        self.segment_size = segment_size
+        self.batch_size = batch_size
+        self.apply_interval = apply_interval
+        self.max_retry_interval = max_retry_interval
+        self.abandoned_scan_interval = abandoned_scan_interval
+
+        self.root = root
+        self.directory, self._slot_lock_fd = self._claim_slot(root)
+
+        self._lock = threading.Lock()
+        self._flushed = threading.Condition(self._lock)
+        self._pending_writes = []
+        self._next_sequence = 1
+        self._durable_sequence = 0
+        self._error = None
+        self._closed = False
+        self._wake_flusher = threading.Event()
+        self._wake_applier = threading.Event()
+        self._stopping = threading.Event()
+
+        # Metrics
+        self.appended = 0
+        self.applied = 0
+        self.replayed_on_start = 0
+        self.adopted = 0
+        self.fsyncs = 0
+        self.apply_failures = 0
+        self.last_apply_error = None
+        self.last_batch_size = 0
+        self.last_batch_seconds = 0.0
+        self.oldest_pending_at = None
+
+        self._checkpoint = self._read_checkpoint()
+        self._recover()
+
+        self._flusher = threading.Thread(target=self._flush_loop, name="checkin-journal-flusher", daemon=True)
+        self._applier = threading.Thread(target=self._apply_loop, name="checkin-journal-applier", daemon=True)
+        self._flusher.start()
+        self._applier.start()
+
+    # Setup and recovery
+
+    @staticmethod
+    def _claim_slot(root):
+        os.makedirs(root, exist_ok=True)
+        for slot in range(MAX_SLOTS):
+            directory = os.path.join(root, f"{SLOT_PREFIX}{slot}")
+            os.makedirs(directory, exist_ok=True)
+            fd = os.open(os.path.join(directory, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            return directory, fd
+        raise JournalError(f"All {MAX_SLOTS} journal slots under {root} are in use")
+
+    def _segments(self):
+        return _list_segments(self.directory)
+
+    def _segment_path(self, index):
+        return os.path.join(self.directory, _segment_name(index))
+
+    def _read_checkpoint(self):
+        return _read_checkpoint(self.directory)
+
+    def _write_checkpoint(self, segment, offset):
+        _write_checkpoint(self.directory, segment, offset)
+        self._checkpoint = (segment, offset)
+
+    def _recover(self):
+        """Truncate a torn tail left by a crash and count records still to be applied."""
+        segments = self._segments()
+        if segments:
+            last = segments[-1]
+            path = self._segment_path(last)
+            size = os.path.getsize(path)
+            valid_end = 0
+            if size:
+                with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    for valid_end, _ in _scan_records(buffer, 0, size):
+                        pass
+            if valid_end < size:
+                print(f"Check-in journal: truncating torn tail of {path} at byte {valid_end}")
+                os.truncate(path, valid_end)
+            self._segment_index = last
+        else:
+            self._segment_index = self._checkpoint[0] or 1
+
+        self._segment_fd = os.open(self._segment_path(self._segment_index),
+                                   os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        self._segment_bytes = os.fstat(self._segment_fd).st_size
+        self._durable_position = (self._segment_index, self._segment_bytes)
+        _fsync_directory(self.directory)
+
+        pending = sum(1 for _ in self._read_pending(limit=None))
+        self.replayed_on_start = pending
+        if pending:
+            self.oldest_pending_at = time.time()
+            print(f"Check-in journal: {pending} check-ins from a previous run will be replayed")
+
+    # Appending
+
+    def append(self, record):
+        """Journal a check-in and return once it is durable on disk."""
+        payload = json.dumps(record, separators=(",", ":")).encode("utf-8")
+        data = RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            if self._closed:
+                raise JournalError("Check-in journal is closed")
+            if self._error is not None:
+                raise JournalError(f"Check-in journal is unavailable: {self._error}")
+            sequence = self._next_sequence
+            self._next_sequence += 1
+            self._pending_writes.append(data)
+            self._wake_flusher.set()
+            while self._durable_sequence < sequence:
+                if self._error is not None:
+                    raise JournalError(f"Check-in journal write failed: {self._error}")
+                self._flushed.wait(1.0)
+        self._wake_applier.set()
+
+    def _flush_loop(self):
+        while True:
+            self._wake_flusher.wait()
+            self._wake_flusher.clear()
+            with self._lock:
+                writes = self._pending_writes
+                self._pending_writes = []
+                last_sequence = self._next_sequence - 1
+                closing = self._closed
+            if writes:
+                try:
+                    self._write_and_sync(b"".join(writes))
+                except OSError as e:
+                    print(f"Check-in journal write failed: {e}")
+                    with self._lock:
+                        self._error = str(e)
+                        self._flushed.notify_all()
+                    return
+                with self._lock:
+                    self._durable_sequence = last_sequence
+                    self.appended += len(writes)
+                    if self.oldest_pending_at is None:
+                        self.oldest_pending_at = time.time()
+                    self._flushed.notify_all()
+            if closing:
+                return
+
+    def _write_and_sync(self, data):
+        if self._segment_bytes and self._segment_bytes + len(data) > self.segment_size:
+            # Seal the current segment and start the next one
+            os.close(self._segment_fd)
+            self._segment_index += 1
+            self._segment_fd = os.open(self._segment_path(self._segment_index),
+                                       os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+            self._segment_bytes = 0
+            _fsync_directory(self.directory)
+        written = 0
+        while written < len(data):
+            written += os.write(self._segment_fd, data[written:])
+        os.fsync(self._segment_fd)
+        self.fsyncs += 1
+        self._segment_bytes += len(data)
+        with self._lock:
+            self._durable_position = (self._segment_index, self._segment_bytes)
+
+    # Applying
+
+    def _read_pending(self, limit):
+        """Yield (segment, offset after record, record) from the checkpoint up to the durable position."""
+        with self._lock:
+            durable_segment, durable_offset = self._durable_position
+        start_segment, start_offset = self._checkpoint
+        count = 0
+        for index in self._segments():
+            if index < start_segment or index > durable_segment:
+                continue
+            path = self._segment_path(index)
+            end = durable_offset if index == durable_segment else os.path.getsize(path)
+            begin = start_offset if index == start_segment else 0
+            if end <= begin:
+                continue
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                for offset, payload in _scan_records(buffer, begin, min(end, len(buffer))):
+                    yield index, offset, json.loads(payload)
+                    count += 1
+                    if limit is not None and count >= limit:
+                        return
+
+    def _apply_loop(self):
+        retry_interval = 0.0
+        next_abandoned_scan = 0.0
+        while True:
+            if retry_interval:
+                # Appends keep setting the wake event; ignore it until the backoff is over
+                self._stopping.wait(retry_interval)
+            else:
+                self._wake_applier.wait(self.apply_interval)
+            self._wake_applier.clear()
+            try:
+                if time.monotonic() >= next_abandoned_scan:
+                    self._drain_abandoned_slots()
+                    next_abandoned_scan = time.monotonic() + self.abandoned_scan_interval
+                drained = self._apply_pending()
+                retry_interval = 0.0
+            except Exception as e:
+                self.apply_failures += 1
+                self.last_apply_error = str(e)
+                retry_interval = min(max(retry_interval * 2, self.apply_interval), self.max_retry_interval)
+                if self._stopping.is_set():
+                    # Whatever is left is replayed by the next worker to open the journal
+                    print(f"Check-in journal apply failed while closing, leaving records for the next start: {e}")
+                    return
+                print(f"Check-in journal apply failed, retrying in {retry_interval:.2f}s: {e}")
+                drained = False
+            with self._lock:
+                if self._closed and (drained or self._error is not None):
+                    return
+
+    def _apply_pending(self):
+        """Apply batches until the journal is drained; return True when nothing is left."""
+        while True:
+            batch = list(self._read_pending(limit=self.batch_size))
+            if not batch:
+                self.oldest_pending_at = None
+                self._remove_applied_segments()
+                return True
+            started = time.monotonic()
+            self.apply_batch([record for _, _, record in batch])
+            self.last_batch_seconds = time.monotonic() - started
+            self.last_batch_size = len(batch)
+            self.last_apply_error = None
+
+            segment, offset, _ = batch[-1]
+            self._write_checkpoint(segment, offset)
+            self.applied += len(batch)
+            if len(batch) < self.batch_size:
+                with self._lock:
+                    caught_up = self._durable_position == (segment, offset)
+                if caught_up:
+                    self.oldest_pending_at = None
+                self._remove_applied_segments()
+                return caught_up
+
+    def _drain_abandoned_slots(self):
+        """Apply and clear the journals of slots no running worker holds."""
+        for name in sorted(os.listdir(self.root)):
+            directory = os.path.join(self.root, name)
+            if not name.startswith(SLOT_PREFIX) or directory == self.directory:
+                continue
+            try:
+                fd = os.open(os.path.join(directory, LOCK_FILE), os.O_RDWR)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            try:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                self._drain_slot(directory)
+            finally:
+                os.close(fd)
+
+    def _drain_slot(self, directory):
+        segments = _list_segments(directory)
+        if not segments:
+            return
+        batch = []
+        drained = 0
+        for index, offset, payload in _unapplied_records(directory):
+            batch.append(json.loads(payload))
+            if len(batch) >= self.batch_size:
+                self.apply_batch(batch)
+                _write_checkpoint(directory, index, offset)
+                drained += len(batch)
+                batch = []
+        if batch:
+            self.apply_batch(batch)
+            drained += len(batch)
+
+        for index in segments:
+            os.remove(os.path.join(directory, _segment_name(index)))
+        try:
+            os.remove(os.path.join(directory, CHECKPOINT_FILE))
+        except FileNotFoundError:
+            pass
+        _fsync_directory(directory)
+        if drained:
+            self.adopted += drained
+            print(f"Check-in journal: applied {drained} check-ins left in abandoned {directory}")
+
+    def _remove_applied_segments(self):
+        checkpoint_segment = self._checkpoint[0]
+        for index in self._segments():
+            if index < checkpoint_segment and index != self._segment_index:
+                os.remove(self._segment_path(index))
+
+    # Reporting and shutdown
+
+    def metrics(self):
+        with self._lock:
+            durable_segment, durable_offset = self._durable_position
+            error = self._error
+        checkpoint_segment, checkpoint_offset = self._checkpoint
+        pending_bytes = 0
+        for index in self._segments():
+            if checkpoint_segment <= index <= durable_segment:
+                size = durable_offset if index == durable_segment else os.path.getsize(self._segment_path(index))
+                pending_bytes += size - (checkpoint_offset if index == checkpoint_segment else 0)
+        oldest = self.oldest_pending_at
+        return {
+            "directory": self.directory,
+            "appended": self.appended,
+            "applied": self.applied,
+            "replayed_on_start": self.replayed_on_start,
+            "adopted_from_abandoned_slots": self.adopted,
+            "pending_records": max(self.appended + self.replayed_on_start - self.applied, 0),
+            "pending_bytes": max(pending_bytes, 0),
+            "lag_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+            "fsyncs": self.fsyncs,
+            "apply_failures": self.apply_failures,
+            "last_apply_error": self.last_apply_error,
+            "last_batch_size": self.last_batch_size,
+            "last_batch_seconds": round(self.last_batch_seconds, 4),
+            "write_error": error,
+            "segment": durable_segment,
+            "checkpoint": {"segment": checkpoint_segment, "offset": checkpoint_offset}
+        }
+
+    def close(self, timeout=5.0):
+        """Flush outstanding appends and give the applier a chance to drain."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wake_flusher.set()
+        self._flusher.join(timeout)
+        self._stopping.set()
+        self._wake_applier.set()
+        self._applier.join(timeout)
+        os.close(self._segment_fd)
+        os.close(self._slot_lock_fd)
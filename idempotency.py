@@ -0,0 +1,126 @@
+"""Response store backing the Idempotency-Key header on write endpoints.
+
+A retried POST carrying the same Idempotency-Key as an earlier request gets the
+original stored response back instead of running the handler (and its queries)
+a second time.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# States returned by reserve()
+NEW = "new"
+PENDING = "pending"
+DONE = "done"
+MISMATCH = "mismatch"
+
+# How long a key stays reserved while its first request is still running
+PENDING_TTL_SECONDS = 60
+
+
+class MemoryResponseStore:
+    """Bounded, TTL-expiring in-process store (one per worker process)."""
+
+    def __init__(self, ttl_seconds, max_entries):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # Pending reservations and completed responses have different TTLs, so
+        # each lives in its own dict where insertion order is expiry order
+        self._pending = OrderedDict()
+        self._done = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending) + len(self._done)
+
+    def _expire(self, now):
+        for entries in (self._pending, self._done):
+            while entries:
+                key, entry = next(iter(entries.items()))
+                if entry["expires"] > now:
+                    break
+                del entries[key]
+
+    def reserve(self, key, fingerprint):
+        """Claim a key for a new request, or report what is already stored."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._done.get(key) or self._pending.get(key)
+            if entry is None:
+                while len(self) >= self.max_entries:
+                    # Give up old responses before reservations still in flight
+                    (self._done or self._pending).popitem(last=False)
+                self._pending[key] = {
+                    "fingerprint": fingerprint,
+                    "response": None,
+                    "expires": now + PENDING_TTL_SECONDS
+                }
+                return NEW, None
+            if entry["fingerprint"] != fingerprint:
+                return MISMATCH, None
+            if entry["response"] is None:
+                return PENDING, None
+            return DONE, entry["response"]
+
+    def complete(self, key, response):
+        with self._lock:
+            entry = self._pending.pop(key, None)
+            if entry is None:
+                return
+            entry["response"] = response
+            entry["expires"] = time.monotonic() + self.ttl_seconds
+            self._done[key] = entry
+
+    def release(self, key):
+        with self._lock:
+            self._pending.pop(key, None)
+            self._done.pop(key, None)
+
+
+class SharedResponseStore:
+    """Store shared by every worker through a shared_state backend; expiry is left to the backend."""
+
+    def __init__(self, backend, ttl_seconds, prefix="idempotency:"):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def reserve(self, key, fingerprint):
+        shared_key = self.prefix + key
+        pending = json.dumps({"fingerprint": fingerprint, "response": None}).encode("utf-8")
+        if self.backend.set(shared_key, pending, PENDING_TTL_SECONDS, only_if_absent=True):
+            return NEW, None
+        raw = self.backend.get(shared_key)
+        if raw is None:
+            # Expired between SET and GET, try once more
+            if self.backend.set(shared_key, pending, PENDING_TTL_SECONDS, only_if_absent=True):
+                return NEW, None
+            return PENDING, None
+        entry = json.loads(raw)
+        if entry["fingerprint"] != fingerprint:
+            return MISMATCH, None
+        if entry["response"] is None:
+            return PENDING, None
+        return DONE, entry["response"]
+
+    def complete(self, key, response):
+        raw = self.backend.get(self.prefix + key)
+        if raw is None:
+            return
+        entry = json.loads(raw)
+        entry["response"] = response
+        if not self.backend.set(self.prefix + key, json.dumps(entry).encode("utf-8"), self.ttl_seconds):
+            # Too large for the backend; drop the reservation so a retry runs normally
+            self.backend.delete(self.prefix + key)
+
+    def release(self, key):
+        self.backend.delete(self.prefix + key)
+
+
+def create_response_store(ttl_seconds, max_entries, backend=None):
+    """Use the shared state backend when it spans workers, otherwise keep responses in-process."""
+    if backend is not None and backend.shared:
+        return SharedResponseStore(backend, ttl_seconds)
+    return MemoryResponseStore(ttl_seconds, max_entries)
@@ -0,0 +1,277 @@
+"""Registry of the hot SQL statements, run as server-side prepared statements.
+
+Each statement is prepared once per database connection and the prepared
+cursor is kept with the connection, so pooled connections skip the parse on
+every later call. Statements can be fetched as dictionaries or as plain tuples
+when the caller only needs positional values, and every execution is timed
+per statement name.
+
+Some statements are templates whose table names depend on the requested term
+(see resolve_term_scope in server.py). Their placeholders are only ever filled
+with internal constants, never with request data; each distinct expansion is
+prepared separately.
+"""
+import threading
+import time
+import weakref
+
+from arrivals import MAX_MINUTE_OFFSET
+
+# Lectures scheduled ahead of time only count towards attendance once they have started
+HELD_LECTURE_CONDITION = "(l.date < CURDATE() OR (l.date = CURDATE() AND l.start_time <= CURTIME()))"
+
+STATEMENTS = {
+    # token_required; the password hash is never needed by routes
+    "user_by_id": "SELECT user_id, university_id, name, role, created_at FROM users WHERE user_id = %s",
+
+    # get_courses
+    "lecturer_courses": """
+        SELECT c.*, u.name as lecturer_name,
+               (SELECT COUNT(*) FROM enrollments e WHERE e.course_id = c.course_id) as student_count,
+               (SELECT COUNT(*) > 0 FROM qr_codes qr
+                JOIN lectures l ON qr.lecture_id = l.lecture_id
+                WHERE l.course_id = c.course_id AND qr.expires_at > NOW()) as has_active_qr,
+               (SELECT TIMESTAMPDIFF(SECOND, NOW(), qr.expires_at)
+                FROM qr_codes qr
+                JOIN lectures l ON qr.lecture_id = l.lecture_id
+                WHERE l.course_id = c.course_id AND qr.expires_at > NOW()
+                ORDER BY qr.expires_at DESC LIMIT 1) as qr_remaining_seconds
+        FROM courses c
+        JOIN users u ON c.lecturer_id = u.user_id
+        WHERE c.lecturer_id = %s
+    """,
+    "student_courses": """
+        SELECT c.*, u.name as lecturer_name,
+               (SELECT COUNT(*) > 0 FROM qr_codes qr
+                JOIN lectures l ON qr.lecture_id = l.lecture_id
+                WHERE l.course_id = c.course_id AND qr.expires_at > NOW()) as has_active_qr,
+               (SELECT TIMESTAMPDIFF(SECOND, NOW(), qr.expires_at)
+                FROM qr_codes qr
+                JOIN lectures l ON qr.lecture_id = l.lecture_id
+                WHERE l.course_id = c.course_id AND qr.expires_at > NOW()
+                ORDER BY qr.expires_at DESC LIMIT 1) as qr_remaining_seconds
+        FROM courses c
+        JOIN enrollments e ON c.course_id = e.course_id
+        JOIN users u ON c.lecturer_id = u.user_id
+        WHERE e.student_id = %s
+    """,
+
+    # check_in
+    "active_qr_by_token": """
+        SELECT qr.qr_id, qr.lecture_id, qr.expires_at, l.course_id
+        FROM qr_codes qr
+        JOIN lectures l ON qr.lecture_id = l.lecture_id
+        WHERE qr.token = %s AND qr.expires_at > NOW()
+    """,
+    "enrollment_exists": "SELECT 1 FROM enrollments WHERE student_id = %s AND course_id = %s",
+    "attendance_exists": "SELECT 1 FROM attendance WHERE student_id = %s AND lecture_id = %s",
+    "insert_attendance": "INSERT INTO attendance (student_id, lecture_id, qr_id) VALUES (%s, %s, %s)",
+    # Counts the check-in just inserted into its arrival bucket (see arrivals.py)
+    "record_arrival": """
+        INSERT INTO arrival_buckets (lecture_id, qr_id, minute_offset, arrivals)
+        SELECT lecture_id, qr_id, LEAST(GREATEST(TIMESTAMPDIFF(MINUTE, generated_at, NOW()), 0), """ + str(MAX_MINUTE_OFFSET) + """), 1
+        FROM qr_codes
+        WHERE qr_id = %s
+        ON DUPLICATE KEY UPDATE arrivals = arrivals + 1
+    """,
+
+    # Term scope of the attendance endpoints
+    "active_term": """
+        SELECT * FROM terms
+        WHERE sealed_at IS NULL AND start_date <= CURDATE()
+        ORDER BY start_date DESC
+        LIMIT 1
+    """,
+    "term_by_id": "SELECT * FROM terms WHERE term_id = %s",
+
+    # get_course_attendance
+    "course_owned_by": "SELECT * FROM courses WHERE course_id = %s AND lecturer_id = %s",
+    "course_students": """
+        SELECT u.user_id, u.name as student_name, u.university_id as student_id
+        FROM users u
+        JOIN enrollments e ON u.user_id = e.student_id
+        WHERE e.course_id = %s AND u.role = 'student'
+        ORDER BY u.name
+    """,
+    "course_lecture_dates": """
+        SELECT l.lecture_id, DATE_FORMAT(l.date, '%Y-%m-%d') as lecture_date
+        FROM {lectures} l
+        WHERE l.course_id = %s AND """ + HELD_LECTURE_CONDITION + """{date_filter}
+        ORDER BY l.date DESC
+    """,
+    "course_attendance_dates": """
+        SELECT a.student_id, DATE_FORMAT(l.date, '%Y-%m-%d') as lecture_date
+        FROM {attendance} a
+        JOIN {lectures} l ON a.lecture_id = l.lecture_id
+        WHERE l.course_id = %s{date_filter}
+    """,
+
+    # get_lecture_attendance
+    "lecture_owned_by": """
+        SELECT l.* FROM lectures l
+        JOIN courses c ON l.course_id = c.course_id
+        WHERE l.lecture_id = %s AND c.lecturer_id = %s
+    """,
+    "lecture_attendance": """
+        SELECT u.user_id, u.name, u.university_id,
+               CASE WHEN a.attendance_id IS NOT NULL THEN 'present' ELSE 'absent' END as status,
+               a.timestamp as check_in_time
+        FROM users u
+        JOIN enrollments e ON u.user_id = e.student_id
+        LEFT JOIN attendance a ON u.user_id = a.student_id AND a.lecture_id = %s
+        WHERE e.course_id = %s AND u.role = 'student'
+    """,
+
+    # get_lecture_arrivals
+    "lecture_arrival_buckets": """
+        SELECT b.qr_id, qr.generated_at, qr.expires_at, b.minute_offset, b.arrivals
+        FROM arrival_buckets b
+        JOIN qr_codes qr ON b.qr_id = qr.qr_id
+        WHERE b.lecture_id = %s
+    """,
+
+    # get_student_attendance
+    "student_lectures": """
+        SELECT l.*,
+               CASE WHEN a.attendance_id IS NOT NULL THEN 'present' ELSE 'absent' END as status,
+               a.timestamp as check_in_time
+        FROM {lectures} l
+        LEFT JOIN {attendance} a ON l.lecture_id = a.lecture_id AND a.student_id = %s
+        WHERE l.course_id = %s AND """ + HELD_LECTURE_CONDITION + """{date_filter}
+        ORDER BY l.date DESC, l.start_time DESC
+    """,
+}
+
+# MySQL error raised when a prepared statement no longer exists on the server,
+# e.g. after the connection was transparently re-established
+ER_UNKNOWN_STMT_HANDLER = 1243
+
+
+class QueryStats:
+    __slots__ = ("calls", "errors", "total_seconds", "max_seconds", "rows")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rows": self.rows,
+            "total_ms": round(self.total_seconds * 1000, 3),
+            "avg_ms": round(self.total_seconds * 1000 / self.calls, 3) if self.calls else 0.0,
+            "max_ms": round(self.max_seconds * 1000, 3)
+        }
+
+
+def _to_text(value):
+    # Older connector versions return string columns as bytearray from the binary protocol
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode("utf-8")
+    return value
+
+
+class QueryRegistry:
+    def __init__(self, statements):
+        self.statements = dict(statements)
+        self._expanded = {}
+        self._cursors = weakref.WeakKeyDictionary()
+        self._stats = {name: QueryStats() for name in self.statements}
+        self._lock = threading.Lock()
+
+    def _sql(self, name, template_args):
+        if not template_args:
+            return self.statements[name]
+        key = (name, tuple(sorted(template_args.items())))
+        sql = self._expanded.get(key)
+        if sql is None:
+            # Cache the expansion so the prepared cursor sees the same string object every time
+            sql = self._expanded.setdefault(key, self.statements[name].format(**template_args))
+        return sql
+
+    def _cursor(self, conn, sql):
+        # Pooled connections wrap the real connection, which is what outlives a checkout
+        cnx = getattr(conn, "_cnx", conn)
+        cursors = self._cursors.get(cnx)
+        if cursors is None:
+            cursors = self._cursors.setdefault(cnx, {})
+        cursor = cursors.get(sql)
+        if cursor is None:
+            cursor = cursors[sql] = cnx.cursor(prepared=True)
+        return cnx, cursor
+
+    def _forget(self, cnx):
+        cursors = self._cursors.pop(cnx, {})
+        for cursor in cursors.values():
+            try:
+                cursor.close()
+            except Exception:
+                pass
+
+    def _execute(self, conn, name, params, template_args, fetch, dictionary):
+        sql = self._sql(name, template_args)
+        stats = self._stats[name]
+        started = time.perf_counter()
+        try:
+            for attempt in range(2):
+                cnx, cursor = self._cursor(conn, sql)
+                try:
+                    cursor.execute(sql, tuple(params))
+                    break
+                except Exception as e:
+                    if attempt or getattr(e, "errno", None) != ER_UNKNOWN_STMT_HANDLER:
+                        raise
+                    self._forget(cnx)
+
+            if fetch == "one":
+                row = cursor.fetchone()
+                # Drain anything left so the cursor can be executed again
+                if row is not None:
+                    cursor.fetchall()
+                rows = [row] if row is not None else []
+            elif fetch == "all":
+                rows = cursor.fetchall()
+            else:
+                rows = None
+
+            if rows and dictionary:
+                columns = cursor.column_names
+                rows = [dict(zip(columns, map(_to_text, row))) for row in rows]
+            elif rows:
+                rows = [tuple(map(_to_text, row)) for row in rows]
+            result = (rows, cursor.rowcount, cursor.lastrowid)
+        except Exception:
+            with self._lock:
+                stats.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                stats.calls += 1
+                stats.total_seconds += elapsed
+                if elapsed > stats.max_seconds:
+                    stats.max_seconds = elapsed
+        with self._lock:
+            stats.rows += len(result[0]) if result[0] is not None else max(result[1], 0)
+        return result
+
+    def fetch_one(self, conn, name, params=(), dictionary=True, **template_args):
+        rows, _, _ = self._execute(conn, name, params, template_args, "one", dictionary)
+        return rows[0] if rows else None
+
+    def fetch_all(self, conn, name, params=(), dictionary=True, **template_args):
+        rows, _, _ = self._execute(conn, name, params, template_args, "all", dictionary)
+        return rows
+
+    def run(self, conn, name, params=(), **template_args):
+        """Execute a write statement and return (rowcount, lastrowid)."""
+        _, rowcount, lastrowid = self._execute(conn, name, params, template_args, None, False)
+        return rowcount, lastrowid
+
+    def stats(self):
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in self._stats.items()}
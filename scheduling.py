@@ -0,0 +1,105 @@
+"""Expansion of recurring lecture schedules into individual lecture dates."""
+import datetime
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# Upper bound on lectures a single schedule request may create
+MAX_OCCURRENCES = 1000
+
+# Longest term a schedule may span, in days
+MAX_TERM_DAYS = 2 * 366
+
+
+def parse_date(value, field):
+    try:
+        return datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a date in YYYY-MM-DD format")
+
+
+def parse_time(value, field):
+    try:
+        return datetime.time.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a time in HH:MM or HH:MM:SS format")
+
+
+def parse_weekday(value):
+    """Accept 0-6 (Monday is 0) or a weekday name such as "monday" or "mon"."""
+    if isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= 6:
+        return value
+    if isinstance(value, str):
+        name = value.strip().lower()
+        for index, weekday in enumerate(WEEKDAYS):
+            if name == weekday or (len(name) >= 3 and weekday.startswith(name)):
+                return index
+    raise ValueError(f"Invalid weekday: {value!r}")
+
+
+def parse_rule(data):
+    """Validate a schedule request body and return the parsed recurrence rule."""
+    term_start = parse_date(data.get('term_start'), 'term_start')
+    term_end = parse_date(data.get('term_end'), 'term_end')
+    if term_end < term_start:
+        raise ValueError("term_end must not be before term_start")
+    if (term_end - term_start).days >= MAX_TERM_DAYS:
+        raise ValueError(f"A term may span at most {MAX_TERM_DAYS} days")
+
+    slots = data.get('slots')
+    if not slots or not isinstance(slots, list):
+        raise ValueError("At least one weekly slot is required")
+
+    parsed_slots = []
+    for slot in slots:
+        if not isinstance(slot, dict):
+            raise ValueError("Each slot must have weekday, start_time and end_time")
+        start_time = parse_time(slot.get('start_time'), 'start_time')
+        end_time = parse_time(slot.get('end_time'), 'end_time')
+        if end_time <= start_time:
+            raise ValueError("Slot end_time must be after start_time")
+        parsed_slots.append((parse_weekday(slot.get('weekday')), start_time, end_time))
+
+    excluded_dates = set()
+    for value in data.get('exclude_dates') or []:
+        excluded_dates.add(parse_date(value, 'exclude_dates'))
+    excluded_ranges = []
+    for holiday in data.get('exclude_ranges') or []:
+        if not isinstance(holiday, dict):
+            raise ValueError("Each excluded range must have start and end dates")
+        start = parse_date(holiday.get('start'), 'exclude_ranges.start')
+        end = parse_date(holiday.get('end'), 'exclude_ranges.end')
+        if end < start:
+            raise ValueError("Excluded range end must not be before its start")
+        excluded_ranges.append((start, end))
+
+    return {
+        "term_start": term_start,
+        "term_end": term_end,
+        "slots": parsed_slots,
+        "excluded_dates": excluded_dates,
+        "excluded_ranges": excluded_ranges
+    }
+
+
+def is_excluded(rule, day):
+    if day in rule["excluded_dates"]:
+        return True
+    return any(start <= day <= end for start, end in rule["excluded_ranges"])
+
+
+def expand_rule(rule):
+    """List (date, start_time, end_time) for every lecture the rule describes, in order."""
+    occurrences = []
+    term_days = (rule["term_end"] - rule["term_start"]).days
+    for weekday, start_time, end_time in rule["slots"]:
+        # Step by offsets from term_start so no date past term_end is ever built
+        # (term_end may be the last date representable)
+        for offset in range((weekday - rule["term_start"].weekday()) % 7, term_days + 1, 7):
+            day = rule["term_start"] + datetime.timedelta(days=offset)
+            if not is_excluded(rule, day):
+                occurrences.append((day, start_time, end_time))
+                if len(occurrences) > MAX_OCCURRENCES:
+                    raise ValueError(f"Schedule would create more than {MAX_OCCURRENCES} lectures")
+
+    # Two slots may describe the same lecture; keep one of each
+    return sorted(set(occurrences))
@@ -0,0 +1,104 @@
+"""JSON encoding and response compression for the API.
+
+Rows from ``cursor(dictionary=True)`` carry DATE, TIME (returned by the MySQL
+connector as ``timedelta``), DATETIME/TIMESTAMP and DECIMAL values. They are
+encoded natively here so responses never go through a slow fallback path.
+"""
+import datetime
+import decimal
+import gzip
+import json
+
+try:
+    import orjson
+except ImportError:  # fall back to the standard library encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def format_timedelta(value):
+    """Format a MySQL TIME value the way MySQL prints it (HH:MM:SS)."""
+    total_seconds = int(value.total_seconds())
+    sign = "-" if total_seconds < 0 else ""
+    hours, remainder = divmod(abs(total_seconds), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{sign}{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+def default(obj):
+    """Encode the non-JSON types MySQL rows contain."""
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, datetime.timedelta):
+        return format_timedelta(obj)
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, (bytes, bytearray)):
+        return obj.decode("utf-8")
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj):
+    """Serialize ``obj`` to compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+    return stdlib_dumps(obj)
+
+
+def stdlib_dumps(obj):
+    return json.dumps(obj, default=default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _accepted_encodings(accept_encoding):
+    """Parse an Accept-Encoding header into {coding: q}, keeping refused (q=0) codings."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+def negotiate_encoding(accept_encoding):
+    """Pick the best supported content coding, preferring brotli over gzip."""
+    accepted = _accepted_encodings(accept_encoding)
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best = None
+    for coding in candidates:
+        # "*" only covers codings the header does not name; an explicit q=0 refuses one
+        quality = accepted[coding] if coding in accepted else accepted.get("*", 0)
+        if quality > 0 and (best is None or quality > best[1]):
+            best = (coding, quality)
+    return best[0] if best else None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    raise ValueError(f"Unsupported content coding: {encoding}")
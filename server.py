@@ -1,37 +1,499 @@
-from flask import Flask, jsonify, request, session
+from flask import Blueprint, Flask, current_app, g, jsonify, request, session
+import click
+from flask.json.provider import DefaultJSONProvider
 import mysql.connector
+import mysql.connector.pooling
 from mysql.connector import Error
 import jwt
 import datetime
 import uuid
-import bcrypt
-import qrcode
 from io import BytesIO
 import base64
+import hashlib
+import hmac
+import time
+import os
+import atexit
+import threading
+from idempotency import create_response_store, PENDING, DONE, MISMATCH
+import serialization
+import scheduling
+import arrivals
+from admission import AdmissionController, Rejected
+import shared_state
+from shared_state import SharedCache
+from checkin_journal import CheckInJournal, JournalError, pending_records
+from queries import QueryRegistry, STATEMENTS, HELD_LECTURE_CONDITION
 
-# Database configuration
-db_config = {
-    "host": "localhost",
-    "user": "root",
-    "password": "",
-    "database": "qr_attendance_system"
+# Encodes MySQL row values (DATE, TIME, TIMESTAMP, DECIMAL) natively and
+# writes the response body as bytes without an intermediate str
+class FastJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        return serialization.dumps(obj).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return serialization.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(serialization.dumps(obj), mimetype=self.mimetype)
+
+# Settings of create_app(); pass a dict to create_app to override any of them
+DEFAULT_CONFIG = {
+    "SECRET_KEY": "your-secret-key-for-sessions",  # Change this to a secure key
+    "JWT_SECRET": "your-jwt-secret-key",  # Change this to a secure key
+    
+    # Database configuration
+    "DATABASE": {
+        "host": "localhost",
+        "user": "root",
+        "password": "",
+        "database": "qr_attendance_system"
+    },
+    "DB_POOL_SIZE": 16,
+    # Open the pool's connections in create_app instead of on the first request
+    "DB_POOL_PREWARM": False,
+    
+    # State shared between worker processes. "memory://" is only correct with a single
+    # worker; use "shm:///tmp/attendance_shared_state" for several workers on one host, or
+    # "redis://localhost:6379/0" (a Redis server or `python shared_state.py serve`) across hosts.
+    "SHARED_STATE_URL": "memory://",
+    "USER_CACHE_TTL_SECONDS": 5 * 60,
+    "COURSE_LIST_CACHE_TTL_SECONDS": 60,
+    "ENROLLMENT_CACHE_TTL_SECONDS": 60 * 60,
+    "CHECK_IN_CACHE_TTL_SECONDS": 24 * 60 * 60,
+    
+    # Idempotency-Key configuration
+    "IDEMPOTENCY_TTL_SECONDS": 24 * 60 * 60,
+    "IDEMPOTENCY_MAX_ENTRIES": 10000,
+    
+    # Responses smaller than this are sent uncompressed
+    "COMPRESSION_MIN_SIZE": 1024,
+    
+    # A QR generated this many minutes before a scheduled lecture starts is attached to it
+    "QR_SLOT_EARLY_MINUTES": 15,
+    
+    # Page size of the course catalog returned by the student bootstrap endpoint
+    "BOOTSTRAP_CATALOG_PAGE_SIZE": 20,
+    
+    # Check-ins are acknowledged once fsynced to this local journal and written to MySQL
+    # by a background applier. Relative paths are inside the app's instance folder.
+    # Set to None to insert check-ins synchronously instead.
+    "CHECK_IN_JOURNAL_DIR": "checkin_journal",
+    "CHECK_IN_JOURNAL_BATCH_SIZE": 500,
+    
+    # Operational metrics under /api/metrics are only served to requests carrying this
+    # value in an X-Metrics-Token header; while it is None the endpoints answer 404
+    "METRICS_TOKEN": None,
+    
+    # Admission control per route class, so reports and bcrypt-heavy auth cannot take the
+    # threads and database connections check-in needs. max_wait is the latency target in
+    # seconds: requests expected to queue longer are refused with 503 and Retry-After.
+    # rate/burst is a token bucket per verified user, or per account and address for auth (429
+    # when empty); address_rate/address_burst is a looser one per client address, sized for a
+    # lecture hall behind one NAT. The concurrencies add up to 14, which leaves two of the
+    # DB_POOL_SIZE connections for the journal applier and the unlimited routes; keep it so.
+    "ADMISSION_CLASSES": {
+        "check_in": {"concurrency": 6, "queue": 200, "max_wait": 1.0, "rate": 1, "burst": 5},
+        "auth": {"concurrency": 2, "queue": 20, "max_wait": 3.0, "rate": 0.2, "burst": 5,
+                 "address_rate": 5, "address_burst": 200},
+        "reports": {"concurrency": 2, "queue": 4, "max_wait": 5.0, "rate": 0.5, "burst": 3},
+        "lists": {"concurrency": 4, "queue": 50, "max_wait": 1.0, "rate": 5, "burst": 20}
+    },
+    "ADMISSION_ENDPOINTS": {
+        "check_in": "check_in",
+        "login": "auth",
+        "register": "auth",
+        "get_course_attendance": "reports",
+        "get_lecture_attendance": "reports",
+        "get_student_attendance": "reports",
+        "get_courses": "lists",
+        "get_all_courses": "lists",
+        "get_lectures": "lists",
+        "get_lecture_arrivals": "lists",
+        "bootstrap_student": "lists",
+        "bootstrap_lecturer": "lists"
+    }
 }
 
-app = Flask(__name__)
-app.secret_key = "your-secret-key-for-sessions"  # Change this to a secure key
-JWT_SECRET = "your-jwt-secret-key"  # Change this to a secure key
+api = Blueprint('api', __name__, cli_group=None)
+
+# Columns shared by the live tables and their per-term archives
+LECTURE_COLUMNS = "lecture_id, course_id, date, start_time, end_time, created_at"
+ATTENDANCE_COLUMNS = "attendance_id, student_id, lecture_id, qr_id, timestamp"
+
+# Pooled connection that ends its transaction when handed back. With pool_reset_session=False
+# the pool does not, so a connection that only ran SELECTs would otherwise sit in the pool
+# holding a read view (stalling purge) and metadata locks (blocking ALTER TABLE).
+class PooledConnection:
+    def __init__(self, conn):
+        self._conn = conn
+    
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+    
+    def close(self):
+        try:
+            if self._conn.in_transaction:
+                self._conn.rollback()
+        except Error as e:
+            print(f"Error rolling back pooled connection: {e}")
+        finally:
+            self._conn.close()
+
+# Everything built from one app's config. create_app keeps it in
+# app.extensions['attendance'], so two apps never share a database, caches or journal.
+class Services:
+    def __init__(self, config):
+        self.db_config = dict(config['DATABASE'])
+        self.db_pool_size = config['DB_POOL_SIZE']
+        self.db_pool = None
+        # Creating the pool opens DB_POOL_SIZE connections, so concurrent first requests
+        # (and the journal applier) must not each build one
+        self.db_pool_lock = threading.Lock()
+        
+        self.shared_state_backend = shared_state.create_backend(config['SHARED_STATE_URL'])
+        self.user_cache = SharedCache(self.shared_state_backend, "users", config['USER_CACHE_TTL_SECONDS'])
+        self.course_list_cache = SharedCache(self.shared_state_backend, "course_lists", config['COURSE_LIST_CACHE_TTL_SECONDS'])
+        self.qr_token_cache = SharedCache(self.shared_state_backend, "qr_tokens", 15 * 60)  # TTL is set per token from its expiry
+        self.enrollment_cache = SharedCache(self.shared_state_backend, "enrollments", config['ENROLLMENT_CACHE_TTL_SECONDS'])
+        self.check_in_cache = SharedCache(self.shared_state_backend, "check_ins", config['CHECK_IN_CACHE_TTL_SECONDS'])
+        self.term_cache = SharedCache(self.shared_state_backend, "terms", 5 * 60)
+        
+        self.idempotency_store = create_response_store(
+            config['IDEMPOTENCY_TTL_SECONDS'],
+            config['IDEMPOTENCY_MAX_ENTRIES'],
+            self.shared_state_backend
+        )
+        self.admission_controller = AdmissionController(config['ADMISSION_CLASSES'], config['ADMISSION_ENDPOINTS'])
+        admitted = sum(limits['concurrency'] for limits in config['ADMISSION_CLASSES'].values())
+        if admitted >= self.db_pool_size:
+            print(f"Warning: admission classes allow {admitted} concurrent requests but DB_POOL_SIZE is {self.db_pool_size}; "
+                  "the journal applier and unlimited routes will wait for connections")
+        
+        # Started with the first request by start_check_in_journal, so CLI commands never open one
+        self.check_in_journal = None
+        self.check_in_journal_dir = None
+        self.check_in_journal_batch_size = config['CHECK_IN_JOURNAL_BATCH_SIZE']
+        self.check_in_journal_lock = threading.Lock()
+        self.closed = False
+    
+    # Pooled connections keep their session between checkouts (pool_reset_session=False)
+    # so the prepared statements cached on them by query_registry stay valid.
+    def create_db_pool(self):
+        with self.db_pool_lock:
+            if self.db_pool is None:
+                self.db_pool = mysql.connector.pooling.MySQLConnectionPool(
+                    pool_name="attendance",
+                    pool_size=self.db_pool_size,
+                    pool_reset_session=False,
+                    **self.db_config
+                )
+        return self.db_pool
+    
+    def get_db_connection(self):
+        try:
+            conn = (self.db_pool or self.create_db_pool()).get_connection()
+        except mysql.connector.errors.PoolError:
+            # Pool exhausted, fall back to a one-off connection
+            try:
+                return mysql.connector.connect(**self.db_config)
+            except Error as e:
+                print(f"Error connecting to MySQL: {e}")
+                return None
+        except Error as e:
+            print(f"Error connecting to MySQL: {e}")
+            return None
+        return PooledConnection(conn)
+    
+    def start_check_in_journal(self, app):
+        with self.check_in_journal_lock:
+            if self.check_in_journal is not None or not self.check_in_journal_dir or self.closed:
+                return
+            
+            # The applier runs outside of any request; give it this app's services
+            def apply_batch(records):
+                with app.app_context():
+                    apply_journaled_check_ins(records)
+            
+            try:
+                self.check_in_journal = CheckInJournal(
+                    self.check_in_journal_dir,
+                    apply_batch,
+                    batch_size=self.check_in_journal_batch_size
+                )
+            except OSError as e:
+                # E.g. a read-only deploy; check-ins are then inserted directly
+                print(f"Check-in journal disabled, cannot open {self.check_in_journal_dir}: {e}")
+                self.check_in_journal_dir = None
+    
+    def close(self):
+        """Stop the journal and the shared-state backend; safe to call more than once."""
+        if self.closed:
+            return
+        self.closed = True
+        if self.check_in_journal is not None:
+            self.check_in_journal.close()
+        self.shared_state_backend.close()
+
+# The services of the app handling the current request or CLI command
+def services():
+    return current_app.extensions['attendance']
 
 # Helper function to get database connection
 def get_db_connection():
+    return services().get_db_connection()
+
+query_registry = QueryRegistry(STATEMENTS)
+
+# Applies a batch of journaled check-ins. Replays after a crash are harmless: check-ins
+# already in attendance are skipped (and so not counted again in arrival_buckets), and
+# INSERT IGNORE covers rows inserted concurrently under the unique_attendance key.
+def apply_journaled_check_ins(records):
+    conn = get_db_connection()
+    if not conn:
+        raise JournalError("Database connection failed")
+    
+    cursor = conn.cursor()
     try:
-        conn = mysql.connector.connect(**db_config)
-        return conn
-    except Error as e:
-        print(f"Error connecting to MySQL: {e}")
+        # The same student may have been journaled twice for a lecture; keep the first
+        pending = {}
+        for record in records:
+            pending.setdefault((record['student_id'], record['lecture_id']), record)
+        
+        # Lock the keys so the arrival counts below only include rows this batch inserts
+        placeholders = ', '.join(['(%s, %s)'] * len(pending))
+        cursor.execute(
+            f"SELECT student_id, lecture_id FROM attendance WHERE (student_id, lecture_id) IN ({placeholders}) FOR UPDATE",
+            [value for key in pending for value in key]
+        )
+        for key in cursor.fetchall():
+            pending.pop(tuple(key), None)
+        if not pending:
+            conn.commit()
+            return
+        new_records = list(pending.values())
+        
+        # Built as one multi-row statement; executemany only batches plain INSERT INTO
+        placeholders = ', '.join(['(%s, %s, %s, %s)'] * len(new_records))
+        params = []
+        for record in new_records:
+            params.extend((record['student_id'], record['lecture_id'], record['qr_id'], record['timestamp']))
+        cursor.execute(
+            f"INSERT IGNORE INTO attendance (student_id, lecture_id, qr_id, timestamp) VALUES {placeholders}",
+            params
+        )
+        
+        qr_ids = list({record['qr_id'] for record in new_records})
+        cursor.execute(
+            f"SELECT qr_id, generated_at FROM qr_codes WHERE qr_id IN ({', '.join(['%s'] * len(qr_ids))})",
+            qr_ids
+        )
+        buckets = arrivals.count_buckets(new_records, dict(cursor.fetchall()))
+        if buckets:
+            placeholders = ', '.join(['(%s, %s, %s, %s)'] * len(buckets))
+            params = []
+            for (lecture_id, qr_id, minute_offset), count in buckets.items():
+                params.extend((lecture_id, qr_id, minute_offset, count))
+            cursor.execute(
+                f"INSERT INTO arrival_buckets (lecture_id, qr_id, minute_offset, arrivals) VALUES {placeholders} "
+                "ON DUPLICATE KEY UPDATE arrivals = arrivals + VALUES(arrivals)",
+                params
+            )
+        conn.commit()
+    except Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+# Renders data as a base64 PNG QR code. qrcode pulls in PIL, the slowest import of the
+# server, so it is only loaded when the first QR code is rendered.
+def render_qr_code(data):
+    import qrcode
+    
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffered = BytesIO()
+    img.save(buffered)
+    return base64.b64encode(buffered.getvalue()).decode()
+
+# Journals a validated check-in; returns False when it has to be inserted directly instead
+def journal_check_in(student_id, qr_data):
+    app_services = services()
+    if app_services.check_in_journal is None:
+        return False
+    
+    try:
+        app_services.check_in_journal.append({
+            "student_id": student_id,
+            "lecture_id": qr_data['lecture_id'],
+            "qr_id": qr_data['qr_id'],
+            "timestamp": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+    except JournalError as e:
+        print(f"Check-in journal unavailable, inserting directly: {e}")
+        return False
+    
+    app_services.check_in_cache.set(f"{student_id}:{qr_data['lecture_id']}", True)
+    return True
+
+# The most recent unsealed term that has started, or None when no terms are defined
+def get_active_term(conn):
+    term_cache = services().term_cache
+    cached = term_cache.get('active')
+    if cached is None:
+        cached = {"term": query_registry.fetch_one(conn, 'active_term')}
+        term_cache.set('active', cached)
+    return cached['term']
+
+# Resolves the ?term= parameter of the attendance endpoints to the tables (or derived
+# tables) to read lectures and attendance from, plus the date range to prune to.
+# Defaults to the active term, which lives entirely in the live tables.
+def resolve_term_scope(conn, term):
+    if not term or term == 'current':
+        active_term = get_active_term(conn)
+        return {
+            "lectures": "lectures",
+            "attendance": "attendance",
+            "start_date": active_term['start_date'] if active_term else None,
+            "end_date": None,
+            "term": active_term
+        }
+    
+    if term == 'all':
+        return {
+            "lectures": f"(SELECT {LECTURE_COLUMNS} FROM lectures UNION ALL SELECT {LECTURE_COLUMNS} FROM lectures_archive)",
+            "attendance": f"(SELECT {ATTENDANCE_COLUMNS} FROM attendance UNION ALL SELECT {ATTENDANCE_COLUMNS} FROM attendance_archive)",
+            "start_date": None,
+            "end_date": None,
+            "term": None
+        }
+    
+    try:
+        term_id = int(term)
+    except ValueError:
+        raise ValueError("term must be 'current', 'all' or a term ID")
+    
+    term_row = query_registry.fetch_one(conn, 'term_by_id', (term_id,))
+    if not term_row:
+        raise ValueError("Term not found")
+    
+    if term_row['sealed_at']:
+        return {
+            "lectures": f"(SELECT {LECTURE_COLUMNS} FROM lectures_archive WHERE term_id = {term_id})",
+            "attendance": f"(SELECT {ATTENDANCE_COLUMNS} FROM attendance_archive WHERE term_id = {term_id})",
+            "start_date": None,
+            "end_date": None,
+            "term": term_row
+        }
+    return {
+        "lectures": "lectures",
+        "attendance": "attendance",
+        "start_date": term_row['start_date'],
+        "end_date": term_row['end_date'],
+        "term": term_row
+    }
+
+# SQL condition (and its parameters) restricting lecture alias l to the scope's dates
+def term_date_filter(scope):
+    condition = ""
+    params = []
+    if scope['start_date']:
+        condition += " AND l.date >= %s"
+        params.append(scope['start_date'])
+    if scope['end_date']:
+        condition += " AND l.date <= %s"
+        params.append(scope['end_date'])
+    return condition, params
+
+def term_summary(scope):
+    term = scope['term']
+    if not term:
         return None
+    return {"term_id": term['term_id'], "name": term['name']}
+
+# Open the check-in journal with the first request rather than in create_app, so
+# CLI commands (which serve none) never claim a slot or drain other workers' slots
+@api.before_app_request
+def start_check_in_journal():
+    app_services = services()
+    if app_services.check_in_journal is None and app_services.check_in_journal_dir:
+        app_services.start_check_in_journal(current_app._get_current_object())
+
+# Rate-limit key of a request. Only a verified token names a user: any other
+# header is free to mint, so it would hand out a fresh bucket per request.
+# Logins are counted per account and address, so guessing at one account is
+# slowed down without letting anyone who knows a student's ID drain the bucket
+# the student logs in with. Anything else is counted per address.
+def admission_key():
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        try:
+            data = jwt.decode(auth_header.split(" ")[1], current_app.config['JWT_SECRET'], algorithms=["HS256"])
+            return f"user:{data['user_id']}"
+        except (jwt.InvalidTokenError, KeyError):
+            pass
+    
+    admission_controller = services().admission_controller
+    if admission_controller.classify(request.endpoint) is admission_controller.classes.get('auth'):
+        data = request.get_json(silent=True)
+        university_id = data.get('university_id') if isinstance(data, dict) else None
+        if university_id:
+            return f"account:{university_id}@{request.remote_addr}"
+    return f"address:{request.remote_addr}"
+
+# Admit the request into its route class, or refuse it before any work is done
+@api.before_app_request
+def admit_request():
+    try:
+        g.admission_ticket = services().admission_controller.admit(request.endpoint, admission_key(), request.remote_addr)
+    except Rejected as e:
+        response = jsonify({"error": e.reason})
+        response.status_code = e.status
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+
+@api.teardown_app_request
+def release_admission(exc):
+    ticket = g.pop('admission_ticket', None)
+    if ticket is not None:
+        services().admission_controller.release(ticket)
+
+# Compress large responses with the best encoding the client accepts
+@api.after_app_request
+def compress_response(response):
+    if (response.direct_passthrough
+            or response.is_streamed
+            or response.status_code < 200
+            or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    
+    body = response.get_data()
+    if len(body) < current_app.config['COMPRESSION_MIN_SIZE']:
+        return response
+    
+    encoding = serialization.negotiate_encoding(request.headers.get('Accept-Encoding'))
+    if not encoding:
+        return response
+    
+    response.set_data(serialization.compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
 
 # Authentication APIs
-@app.route('/api/login', methods=['POST'])
+@api.route('/api/login', methods=['POST'])
 def login():
     data = request.get_json()
     university_id = data.get('university_id')
@@ -49,6 +511,7 @@ def login():
         cursor.execute("SELECT * FROM users WHERE university_id = %s", (university_id,))
         user = cursor.fetchone()
         
+        import bcrypt
         if not user or not bcrypt.checkpw(password.encode('utf-8'), user['password'].encode('utf-8')):
             return jsonify({"error": "Invalid credentials"}), 401
         
@@ -58,7 +521,7 @@ def login():
             'university_id': user['university_id'],
             'role': user['role'],
             'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
-        }, JWT_SECRET, algorithm="HS256")
+        }, current_app.config['JWT_SECRET'], algorithm="HS256")
         
         return jsonify({
             "message": "Login successful",
@@ -76,7 +539,7 @@ def login():
         cursor.close()
         conn.close()
 
-@app.route('/api/register', methods=['POST'])
+@api.route('/api/register', methods=['POST'])
 def register():
     data = request.get_json()
     university_id = data.get('university_id')
@@ -102,6 +565,7 @@ def register():
             return jsonify({"error": "User with this university ID already exists"}), 409
         
         # Hash the password
+        import bcrypt
         hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
         
         # Insert new user
@@ -132,20 +596,23 @@ def token_required(f):
             return jsonify({"error": "Token is missing"}), 401
         
         try:
-            data = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-            
-            conn = get_db_connection()
-            if not conn:
-                return jsonify({"error": "Database connection failed"}), 500
+            data = jwt.decode(token, current_app.config['JWT_SECRET'], algorithms=["HS256"])
             
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM users WHERE user_id = %s", (data['user_id'],))
-            current_user = cursor.fetchone()
-            cursor.close()
-            conn.close()
-            
-            if not current_user:
-                return jsonify({"error": "User not found"}), 401
+            current_user = services().user_cache.get(data['user_id'])
+            if current_user is None:
+                conn = get_db_connection()
+                if not conn:
+                    return jsonify({"error": "Database connection failed"}), 500
+                
+                try:
+                    current_user = query_registry.fetch_one(conn, 'user_by_id', (data['user_id'],))
+                finally:
+                    conn.close()
+                
+                if not current_user:
+                    return jsonify({"error": "User not found"}), 401
+                
+                services().user_cache.set(data['user_id'], current_user)
         except jwt.ExpiredSignatureError:
             return jsonify({"error": "Token has expired"}), 401
         except jwt.InvalidTokenError:
@@ -156,66 +623,106 @@ def token_required(f):
     decorated.__name__ = f.__name__
     return decorated
 
+# Replays the stored response for retried writes carrying the same Idempotency-Key.
+# Must be applied below token_required so keys are scoped to the current user.
+def idempotent(f):
+    def decorated(current_user, *args, **kwargs):
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if not idempotency_key:
+            return f(current_user, *args, **kwargs)
+        
+        if len(idempotency_key) > 255:
+            return jsonify({"error": "Idempotency-Key must be at most 255 characters"}), 400
+        
+        store_key = f"{current_user['user_id']}:{request.method}:{request.path}:{idempotency_key}"
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+        idempotency_store = services().idempotency_store
+        
+        try:
+            state, stored = idempotency_store.reserve(store_key, fingerprint)
+        except (OSError, shared_state.RespError) as e:
+            # Without the store a retry could run twice, so refuse instead of failing open
+            print(f"Idempotency store unavailable: {e!r}")
+            response = jsonify({"error": "Idempotency-Key cannot be honoured right now, retry shortly"})
+            response.status_code = 503
+            response.headers['Retry-After'] = '1'
+            return response
+        if state == DONE:
+            response = current_app.response_class(stored['body'], status=stored['status'], mimetype=stored['mimetype'])
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+        if state == PENDING:
+            return jsonify({"error": "A request with this Idempotency-Key is still being processed"}), 409
+        if state == MISMATCH:
+            return jsonify({"error": "Idempotency-Key was already used with a different request body"}), 422
+        
+        try:
+            response = current_app.make_response(f(current_user, *args, **kwargs))
+        except Exception:
+            idempotency_store.release(store_key)
+            raise
+        
+        try:
+            # Server errors are not stored so the client can retry them
+            if response.status_code >= 500:
+                idempotency_store.release(store_key)
+            else:
+                idempotency_store.complete(store_key, {
+                    "status": response.status_code,
+                    "mimetype": response.mimetype,
+                    "body": response.get_data(as_text=True)
+                })
+        except (OSError, shared_state.RespError) as e:
+            # The pending reservation expires on its own after PENDING_TTL_SECONDS
+            print(f"Could not store the response for an Idempotency-Key: {e!r}")
+        return response
+    
+    decorated.__name__ = f.__name__
+    return decorated
+
+# Cached course lists store QR countdowns as of when they were cached; age them on the way out
+def age_course_list(courses, cached_at):
+    elapsed = int(time.time() - cached_at)
+    aged = []
+    for course in courses:
+        if course['qr_remaining_seconds'] is not None:
+            remaining = course['qr_remaining_seconds'] - elapsed
+            course = dict(
+                course,
+                has_active_qr=1 if remaining > 0 else 0,
+                qr_remaining_seconds=remaining if remaining > 0 else None
+            )
+        aged.append(course)
+    return aged
+
 # Course APIs
-@app.route('/api/courses', methods=['GET'])
+@api.route('/api/courses', methods=['GET'])
 @token_required
 def get_courses(current_user):
+    cached = services().course_list_cache.get(current_user['user_id'])
+    if cached is not None:
+        return jsonify({"courses": age_course_list(cached['courses'], cached['cached_at'])}), 200
+    
     conn = get_db_connection()
     if not conn:
         return jsonify({"error": "Database connection failed"}), 500
     
-    cursor = conn.cursor(dictionary=True)
     try:
         if current_user['role'] == 'lecturer':
             # For lecturers, get their courses with student counts and active QR codes
-            cursor.execute(
-                """
-                SELECT c.*, u.name as lecturer_name,
-                       (SELECT COUNT(*) FROM enrollments e WHERE e.course_id = c.course_id) as student_count,
-                       (SELECT COUNT(*) > 0 FROM qr_codes qr 
-                        JOIN lectures l ON qr.lecture_id = l.lecture_id 
-                        WHERE l.course_id = c.course_id AND qr.expires_at > NOW()) as has_active_qr,
-                       (SELECT TIMESTAMPDIFF(SECOND, NOW(), qr.expires_at) 
-                        FROM qr_codes qr 
-                        JOIN lectures l ON qr.lecture_id = l.lecture_id 
-                        WHERE l.course_id = c.course_id AND qr.expires_at > NOW() 
-                        ORDER BY qr.expires_at DESC LIMIT 1) as qr_remaining_seconds
-                FROM courses c
-                JOIN users u ON c.lecturer_id = u.user_id
-                WHERE c.lecturer_id = %s
-                """,
-                (current_user['user_id'],)
-            )
+            courses = query_registry.fetch_all(conn, 'lecturer_courses', (current_user['user_id'],))
         else:  # student
             # For students, get their enrolled courses with lecturer names and active QR codes
-            cursor.execute(
-                """
-                SELECT c.*, u.name as lecturer_name,
-                       (SELECT COUNT(*) > 0 FROM qr_codes qr 
-                        JOIN lectures l ON qr.lecture_id = l.lecture_id 
-                        WHERE l.course_id = c.course_id AND qr.expires_at > NOW()) as has_active_qr,
-                       (SELECT TIMESTAMPDIFF(SECOND, NOW(), qr.expires_at) 
-                        FROM qr_codes qr 
-                        JOIN lectures l ON qr.lecture_id = l.lecture_id 
-                        WHERE l.course_id = c.course_id AND qr.expires_at > NOW() 
-                        ORDER BY qr.expires_at DESC LIMIT 1) as qr_remaining_seconds
-                FROM courses c
-                JOIN enrollments e ON c.course_id = e.course_id
-                JOIN users u ON c.lecturer_id = u.user_id
-                WHERE e.student_id = %s
-                """,
-                (current_user['user_id'],)
-            )
+            courses = query_registry.fetch_all(conn, 'student_courses', (current_user['user_id'],))
         
-        courses = cursor.fetchall()
+        services().course_list_cache.set(current_user['user_id'], {"cached_at": time.time(), "courses": courses})
         return jsonify({"courses": courses}), 200
     except Error as e:
         return jsonify({"error": str(e)}), 500
     finally:
-        cursor.close()
         conn.close()
 
-@app.route('/api/courses/all', methods=['GET'])
+@api.route('/api/courses/all', methods=['GET'])
 @token_required
 def get_all_courses(current_user):
     if current_user['role'] != 'student':
@@ -258,8 +765,9 @@ def get_all_courses(current_user):
         cursor.close()
         conn.close()
 
-@app.route('/api/courses', methods=['POST'])
+@api.route('/api/courses', methods=['POST'])
 @token_required
+@idempotent
 def create_course(current_user):
     if current_user['role'] != 'lecturer':
         return jsonify({"error": "Only lecturers can create courses"}), 403
@@ -282,6 +790,7 @@ def create_course(current_user):
             (course_code, course_name, current_user['user_id'])
         )
         conn.commit()
+        services().course_list_cache.invalidate(current_user['user_id'])
         
         return jsonify({
             "message": "Course created successfully",
@@ -294,7 +803,7 @@ def create_course(current_user):
         cursor.close()
         conn.close()
 
-@app.route('/api/courses/<int:course_id>', methods=['DELETE'])
+@api.route('/api/courses/<int:course_id>', methods=['DELETE'])
 @token_required
 def delete_course(current_user, course_id):
     if current_user['role'] != 'lecturer':
@@ -327,6 +836,18 @@ def delete_course(current_user, course_id):
         
         print(f"Found {len(lecture_ids)} lectures to delete")
         
+        # Collect what other workers may have cached about this course
+        cursor.execute("SELECT student_id FROM enrollments WHERE course_id = %s", (course_id,))
+        student_ids = [row['student_id'] for row in cursor.fetchall()]
+        qr_tokens = []
+        if lecture_ids:
+            lecture_ids_str = ','.join(['%s'] * len(lecture_ids))
+            cursor.execute(
+                f"SELECT token FROM qr_codes WHERE lecture_id IN ({lecture_ids_str})",
+                lecture_ids
+            )
+            qr_tokens = [row['token'] for row in cursor.fetchall()]
+        
         # No need to explicitly start a transaction - MySQL connector automatically uses transactions
         # and we'll commit at the end or rollback on error
         
@@ -338,6 +859,10 @@ def delete_course(current_user, course_id):
                 lecture_ids
             )
             print(f"Deleted {cursor.rowcount} attendance records")
+            cursor.execute(
+                f"DELETE FROM arrival_buckets WHERE lecture_id IN ({lecture_ids_str})",
+                lecture_ids
+            )
         
         # Delete QR codes (depends on lectures)
         if lecture_ids:
@@ -352,6 +877,22 @@ def delete_course(current_user, course_id):
         cursor.execute("DELETE FROM lectures WHERE course_id = %s", (course_id,))
         print(f"Deleted {cursor.rowcount} lectures")
         
+        # Delete the course's history from sealed terms
+        cursor.execute(
+            "DELETE aa FROM attendance_archive aa JOIN lectures_archive la ON aa.lecture_id = la.lecture_id WHERE la.course_id = %s",
+            (course_id,)
+        )
+        cursor.execute(
+            "DELETE ba FROM arrival_buckets_archive ba JOIN lectures_archive la ON ba.lecture_id = la.lecture_id WHERE la.course_id = %s",
+            (course_id,)
+        )
+        cursor.execute(
+            "DELETE qa FROM qr_codes_archive qa JOIN lectures_archive la ON qa.lecture_id = la.lecture_id WHERE la.course_id = %s",
+            (course_id,)
+        )
+        cursor.execute("DELETE FROM lectures_archive WHERE course_id = %s", (course_id,))
+        print(f"Deleted {cursor.rowcount} archived lectures")
+        
         # Delete enrollments (depends on course)
         cursor.execute("DELETE FROM enrollments WHERE course_id = %s", (course_id,))
         print(f"Deleted {cursor.rowcount} enrollments (unenrolled students)")
@@ -363,6 +904,10 @@ def delete_course(current_user, course_id):
         # Commit the transaction
         conn.commit()
         
+        services().course_list_cache.invalidate(current_user['user_id'], *student_ids)
+        services().enrollment_cache.invalidate(*[f"{student_id}:{course_id}" for student_id in student_ids])
+        services().qr_token_cache.invalidate(*qr_tokens)
+        
         print(f"Course deletion complete: {course_id}")
         return jsonify({"message": "Course and all related data deleted successfully"}), 200
     except Exception as e:
@@ -377,8 +922,9 @@ def delete_course(current_user, course_id):
         conn.close()
 
 # Lecture APIs
-@app.route('/api/lectures', methods=['POST'])
+@api.route('/api/lectures', methods=['POST'])
 @token_required
+@idempotent
 def create_lecture(current_user):
     if current_user['role'] != 'lecturer':
         return jsonify({"error": "Only lecturers can create lectures"}), 403
@@ -424,7 +970,73 @@ def create_lecture(current_user):
         cursor.close()
         conn.close()
 
-@app.route('/api/courses/<int:course_id>/lectures', methods=['GET'])
+@api.route('/api/courses/<int:course_id>/lectures/schedule', methods=['POST'])
+@token_required
+@idempotent
+def schedule_lectures(current_user, course_id):
+    """Create every lecture of a weekly recurring schedule in one batched insert."""
+    if current_user['role'] != 'lecturer':
+        return jsonify({"error": "Only lecturers can schedule lectures"}), 403
+    
+    data = request.get_json()
+    try:
+        rule = scheduling.parse_rule(data or {})
+        occurrences = scheduling.expand_rule(rule)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({"error": "Database connection failed"}), 500
+    
+    cursor = conn.cursor(dictionary=True)
+    try:
+        # Verify the lecturer owns this course
+        cursor.execute(
+            "SELECT course_id FROM courses WHERE course_id = %s AND lecturer_id = %s",
+            (course_id, current_user['user_id'])
+        )
+        if not cursor.fetchone():
+            return jsonify({"error": "Course not found or you don't have permission"}), 404
+        
+        # Skip lectures that already exist so a schedule can be re-submitted safely
+        cursor.execute(
+            "SELECT date, start_time FROM lectures WHERE course_id = %s AND date BETWEEN %s AND %s",
+            (course_id, rule['term_start'], rule['term_end'])
+        )
+        existing = {(row['date'], serialization.format_timedelta(row['start_time'])) for row in cursor.fetchall()}
+        
+        new_lectures = [
+            (course_id, date, start_time, end_time)
+            for date, start_time, end_time in occurrences
+            if (date, start_time.strftime('%H:%M:%S')) not in existing
+        ]
+        
+        # executemany sends a single multi-row INSERT for this statement
+        if new_lectures:
+            cursor.executemany(
+                "INSERT INTO lectures (course_id, date, start_time, end_time) VALUES (%s, %s, %s, %s)",
+                new_lectures
+            )
+        conn.commit()
+        
+        print(f"Scheduled {len(new_lectures)} lectures for course {course_id}, skipped {len(occurrences) - len(new_lectures)} existing")
+        
+        return jsonify({
+            "message": "Lectures scheduled successfully",
+            "lectures_created": len(new_lectures),
+            "lectures_skipped": len(occurrences) - len(new_lectures),
+            "first_date": occurrences[0][0].isoformat() if occurrences else None,
+            "last_date": occurrences[-1][0].isoformat() if occurrences else None
+        }), 201
+    except Error as e:
+        conn.rollback()
+        return jsonify({"error": str(e)}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+@api.route('/api/courses/<int:course_id>/lectures', methods=['GET'])
 @token_required
 def get_lectures(current_user, course_id):
     conn = get_db_connection()
@@ -465,8 +1077,9 @@ def get_lectures(current_user, course_id):
         conn.close()
 
 # QR Code APIs
-@app.route('/api/courses/<int:course_id>/qrcode', methods=['POST'])
+@api.route('/api/courses/<int:course_id>/qrcode', methods=['POST'])
 @token_required
+@idempotent
 def generate_course_qr(current_user, course_id):
     if current_user['role'] != 'lecturer':
         return jsonify({"error": "Only lecturers can generate QR codes"}), 403
@@ -490,21 +1103,39 @@ def generate_course_qr(current_user, course_id):
         if not cursor.fetchone():
             return jsonify({"error": "Course not found or you don't have permission"}), 404
         
-        # Create a lecture for today
-        today = datetime.datetime.now().date()
-        current_time = datetime.datetime.now().time()
-        end_time = (datetime.datetime.now() + datetime.timedelta(minutes=expiry_minutes)).time()
-        
-        print(f"Creating lecture for today {today} from {current_time} to {end_time}")
+        now = datetime.datetime.now()
         
+        # Attach the QR to the scheduled lecture for the current slot, if there is one
         cursor.execute(
-            "INSERT INTO lectures (course_id, date, start_time, end_time) VALUES (%s, %s, %s, %s)",
-            (course_id, today, current_time, end_time)
+            """
+            SELECT lecture_id FROM lectures
+            WHERE course_id = %s AND date = %s AND start_time <= %s AND end_time > %s
+            ORDER BY start_time
+            LIMIT 1
+            """,
+            (course_id, now.date(), (now + datetime.timedelta(minutes=current_app.config['QR_SLOT_EARLY_MINUTES'])).time(), now.time())
         )
-        conn.commit()
-        lecture_id = cursor.lastrowid
-        
-        print(f"Created lecture with ID: {lecture_id}")
+        scheduled_lecture = cursor.fetchone()
+        
+        if scheduled_lecture:
+            lecture_id = scheduled_lecture['lecture_id']
+            print(f"Using scheduled lecture with ID: {lecture_id}")
+        else:
+            # No lecture scheduled for this slot, create one for today
+            today = now.date()
+            current_time = now.time()
+            end_time = (now + datetime.timedelta(minutes=expiry_minutes)).time()
+            
+            print(f"Creating lecture for today {today} from {current_time} to {end_time}")
+            
+            cursor.execute(
+                "INSERT INTO lectures (course_id, date, start_time, end_time) VALUES (%s, %s, %s, %s)",
+                (course_id, today, current_time, end_time)
+            )
+            conn.commit()
+            lecture_id = cursor.lastrowid
+            
+            print(f"Created lecture with ID: {lecture_id}")
         
         # Generate a unique token
         token = str(uuid.uuid4())
@@ -523,23 +1154,20 @@ def generate_course_qr(current_user, course_id):
         
         print(f"Saved QR code info with ID: {qr_id}")
         
+        # Make the new token and active QR state visible to every worker
+        services().qr_token_cache.set(token, {
+            "qr_id": qr_id,
+            "lecture_id": lecture_id,
+            "course_id": course_id,
+            "expires_at": expires_at
+        }, ttl=expiry_minutes * 60)
+        cursor.execute("SELECT student_id FROM enrollments WHERE course_id = %s", (course_id,))
+        services().course_list_cache.invalidate(current_user['user_id'], *[row['student_id'] for row in cursor.fetchall()])
+        
         try:
             # Generate QR code
             print("Starting QR code generation...")
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(token)
-            qr.make(fit=True)
-            
-            print("QR code generated, creating image...")
-            img = qr.make_image(fill_color="black", back_color="white")
-            buffered = BytesIO()
-            img.save(buffered)
-            img_str = base64.b64encode(buffered.getvalue()).decode()
+            img_str = render_qr_code(token)
             print("QR code image created successfully")
             
             # Calculate remaining time in seconds
@@ -547,6 +1175,7 @@ def generate_course_qr(current_user, course_id):
             
             return jsonify({
                 "qr_id": qr_id,
+                "lecture_id": lecture_id,
                 "token": token,
                 "expires_at": expires_at.isoformat(),
                 "remaining_seconds": remaining_seconds,
@@ -568,8 +1197,9 @@ def generate_course_qr(current_user, course_id):
         conn.close()
 
 # Attendance APIs
-@app.route('/api/attendance/check-in', methods=['POST'])
+@api.route('/api/attendance/check-in', methods=['POST'])
 @token_required
+@idempotent
 def check_in(current_user):
     if current_user['role'] != 'student':
         return jsonify({"error": "Only students can check in to lectures"}), 403
@@ -580,54 +1210,69 @@ def check_in(current_user):
     if not token:
         return jsonify({"error": "QR code token is required"}), 400
     
+    # With the token and enrollment cached, a journaled check-in never waits on MySQL
+    app_services = services()
+    qr_data = app_services.qr_token_cache.get(token)
+    if qr_data is not None and app_services.check_in_journal is not None:
+        if qr_data['expires_at'] <= datetime.datetime.now():
+            return jsonify({"error": "Invalid or expired QR code"}), 400
+        
+        if app_services.enrollment_cache.get(f"{current_user['user_id']}:{qr_data['course_id']}"):
+            if app_services.check_in_cache.get(f"{current_user['user_id']}:{qr_data['lecture_id']}"):
+                return jsonify({"error": "You have already checked in to this lecture"}), 400
+            
+            if journal_check_in(current_user['user_id'], qr_data):
+                return jsonify({"message": "Attendance recorded successfully"}), 201
+    
     conn = get_db_connection()
     if not conn:
         return jsonify({"error": "Database connection failed"}), 500
     
-    cursor = conn.cursor(dictionary=True)
     try:
         # Verify QR code is valid and not expired
-        cursor.execute(
-            "SELECT qr.*, l.course_id FROM qr_codes qr JOIN lectures l ON qr.lecture_id = l.lecture_id WHERE qr.token = %s AND qr.expires_at > NOW()",
-            (token,)
-        )
-        qr_data = cursor.fetchone()
-        
-        if not qr_data:
+        qr_data = app_services.qr_token_cache.get(token)
+        if qr_data is None:
+            qr_data = query_registry.fetch_one(conn, 'active_qr_by_token', (token,))
+            if qr_data:
+                remaining_seconds = (qr_data['expires_at'] - datetime.datetime.now()).total_seconds()
+                if remaining_seconds > 0:
+                    app_services.qr_token_cache.set(token, qr_data, ttl=remaining_seconds)
+        
+        if not qr_data or qr_data['expires_at'] <= datetime.datetime.now():
             return jsonify({"error": "Invalid or expired QR code"}), 400
         
         # Verify student is enrolled in the course
-        cursor.execute(
-            "SELECT * FROM enrollments WHERE student_id = %s AND course_id = %s",
-            (current_user['user_id'], qr_data['course_id'])
-        )
-        if not cursor.fetchone():
-            return jsonify({"error": "You are not enrolled in this course"}), 403
+        enrollment_key = f"{current_user['user_id']}:{qr_data['course_id']}"
+        if not app_services.enrollment_cache.get(enrollment_key):
+            if not query_registry.fetch_one(conn, 'enrollment_exists', (current_user['user_id'], qr_data['course_id']), dictionary=False):
+                return jsonify({"error": "You are not enrolled in this course"}), 403
+            app_services.enrollment_cache.set(enrollment_key, True)
         
         # Check if already checked in
-        cursor.execute(
-            "SELECT * FROM attendance WHERE student_id = %s AND lecture_id = %s",
-            (current_user['user_id'], qr_data['lecture_id'])
-        )
-        if cursor.fetchone():
+        check_in_key = f"{current_user['user_id']}:{qr_data['lecture_id']}"
+        if app_services.check_in_cache.get(check_in_key):
+            return jsonify({"error": "You have already checked in to this lecture"}), 400
+        if query_registry.fetch_one(conn, 'attendance_exists', (current_user['user_id'], qr_data['lecture_id']), dictionary=False):
+            app_services.check_in_cache.set(check_in_key, True)
             return jsonify({"error": "You have already checked in to this lecture"}), 400
         
+        if journal_check_in(current_user['user_id'], qr_data):
+            return jsonify({"message": "Attendance recorded successfully"}), 201
+        
         # Record attendance
-        cursor.execute(
-            "INSERT INTO attendance (student_id, lecture_id, qr_id) VALUES (%s, %s, %s)",
-            (current_user['user_id'], qr_data['lecture_id'], qr_data['qr_id'])
-        )
+        query_registry.run(conn, 'insert_attendance', (current_user['user_id'], qr_data['lecture_id'], qr_data['qr_id']))
+        query_registry.run(conn, 'record_arrival', (qr_data['qr_id'],))
         conn.commit()
+        app_services.check_in_cache.set(check_in_key, True)
         
         return jsonify({"message": "Attendance recorded successfully"}), 201
     except Error as e:
         conn.rollback()
         return jsonify({"error": str(e)}), 500
     finally:
-        cursor.close()
         conn.close()
 
-@app.route('/api/courses/<int:course_id>/attendance', methods=['GET'])
+@api.route('/api/courses/<int:course_id>/attendance', methods=['GET'])
 @token_required
 def get_course_attendance(current_user, course_id):
     """Get attendance data for all students in a course across all dates."""
@@ -640,87 +1285,65 @@ def get_course_attendance(current_user, course_id):
     if not conn:
         return jsonify({"error": "Database connection failed"}), 500
     
-    cursor = conn.cursor(dictionary=True)
     try:
         # Verify the lecturer owns this course
-        cursor.execute(
-            "SELECT * FROM courses WHERE course_id = %s AND lecturer_id = %s",
-            (course_id, current_user['user_id'])
-        )
-        course = cursor.fetchone()
+        course = query_registry.fetch_one(conn, 'course_owned_by', (course_id, current_user['user_id']))
         if not course:
             print(f"Course not found or unauthorized: {course_id}")
             return jsonify({"error": "Course not found or you don't have permission"}), 404
         
         print(f"Course found: {course['course_code']} - {course['course_name']}")
         
+        try:
+            scope = resolve_term_scope(conn, request.args.get('term'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        date_filter, date_params = term_date_filter(scope)
+        
         # Get all students enrolled in the course
-        cursor.execute(
-            """
-            SELECT u.user_id, u.name as student_name, u.university_id as student_id
-            FROM users u
-            JOIN enrollments e ON u.user_id = e.student_id
-            WHERE e.course_id = %s AND u.role = 'student'
-            ORDER BY u.name
-            """,
-            (course_id,)
-        )
-        students = cursor.fetchall()
+        students = query_registry.fetch_all(conn, 'course_students', (course_id,))
         
         print(f"Found {len(students)} students enrolled in the course")
         
         if not students:
             return jsonify({
                 "students": [],
-                "dates": []
+                "dates": [],
+                "term": term_summary(scope)
             }), 200
         
         # Get all lectures for this course
-        cursor.execute(
-            """
-            SELECT lecture_id, DATE_FORMAT(date, '%Y-%m-%d') as lecture_date
-            FROM lectures
-            WHERE course_id = %s
-            ORDER BY date DESC
-            """,
-            (course_id,)
+        lectures = query_registry.fetch_all(
+            conn, 'course_lecture_dates', (course_id, *date_params), dictionary=False,
+            lectures=scope['lectures'], date_filter=date_filter
         )
-        lectures = cursor.fetchall()
         
         print(f"Found {len(lectures)} lectures for the course")
         
         if not lectures:
             return jsonify({
                 "students": [],
-                "dates": []
+                "dates": [],
+                "term": term_summary(scope)
             }), 200
         
         # Extract unique dates
-        dates = list(set(lecture['lecture_date'] for lecture in lectures))
+        dates = list(set(lecture_date for _, lecture_date in lectures))
         dates.sort(reverse=True)  # Most recent dates first
         
         print(f"Found {len(dates)} unique lecture dates")
         
         # Get all attendance records for this course in one query for efficiency
-        cursor.execute(
-            """
-            SELECT a.student_id, l.lecture_id, DATE_FORMAT(l.date, '%Y-%m-%d') as lecture_date
-            FROM attendance a
-            JOIN lectures l ON a.lecture_id = l.lecture_id
-            WHERE l.course_id = %s
-            """,
-            (course_id,)
+        all_attendance = query_registry.fetch_all(
+            conn, 'course_attendance_dates', (course_id, *date_params), dictionary=False,
+            attendance=scope['attendance'], lectures=scope['lectures'], date_filter=date_filter
         )
-        all_attendance = cursor.fetchall()
         
         print(f"Found {len(all_attendance)} attendance records")
         
         # Create a lookup map for quick access
         attendance_lookup = {}
-        for record in all_attendance:
-            student_id = record['student_id']
-            date = record['lecture_date']
-            
+        for student_id, date in all_attendance:
             if student_id not in attendance_lookup:
                 attendance_lookup[student_id] = set()
             
@@ -750,7 +1373,8 @@ def get_course_attendance(current_user, course_id):
         
         result = {
             "students": formatted_students,
-            "dates": dates
+            "dates": dates,
+            "term": term_summary(scope)
         }
         
         print(f"Returning attendance data with {len(formatted_students)} students and {len(dates)} dates")
@@ -762,10 +1386,9 @@ def get_course_attendance(current_user, course_id):
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
     finally:
-        cursor.close()
         conn.close()
 
-@app.route('/api/lectures/<int:lecture_id>/attendance', methods=['GET'])
+@api.route('/api/lectures/<int:lecture_id>/attendance', methods=['GET'])
 @token_required
 def get_lecture_attendance(current_user, lecture_id):
     if current_user['role'] != 'lecturer':
@@ -775,31 +1398,14 @@ def get_lecture_attendance(current_user, lecture_id):
     if not conn:
         return jsonify({"error": "Database connection failed"}), 500
     
-    cursor = conn.cursor(dictionary=True)
     try:
         # Verify the lecturer owns this lecture
-        cursor.execute(
-            "SELECT l.* FROM lectures l JOIN courses c ON l.course_id = c.course_id WHERE l.lecture_id = %s AND c.lecturer_id = %s",
-            (lecture_id, current_user['user_id'])
-        )
-        lecture = cursor.fetchone()
+        lecture = query_registry.fetch_one(conn, 'lecture_owned_by', (lecture_id, current_user['user_id']))
         if not lecture:
             return jsonify({"error": "Lecture not found or you don't have permission"}), 404
         
         # Get all students enrolled in the course
-        cursor.execute(
-            """
-            SELECT u.user_id, u.name, u.university_id,
-                   CASE WHEN a.attendance_id IS NOT NULL THEN 'present' ELSE 'absent' END as status,
-                   a.timestamp as check_in_time
-            FROM users u
-            JOIN enrollments e ON u.user_id = e.student_id
-            LEFT JOIN attendance a ON u.user_id = a.student_id AND a.lecture_id = %s
-            WHERE e.course_id = %s AND u.role = 'student'
-            """,
-            (lecture_id, lecture['course_id'])
-        )
-        attendance_records = cursor.fetchall()
+        attendance_records = query_registry.fetch_all(conn, 'lecture_attendance', (lecture_id, lecture['course_id']))
         
         return jsonify({
             "lecture": lecture,
@@ -811,10 +1417,38 @@ def get_lecture_attendance(current_user, lecture_id):
     except Error as e:
         return jsonify({"error": str(e)}), 500
     finally:
-        cursor.close()
         conn.close()
 
-@app.route('/api/students/attendance', methods=['GET'])
+# Arrival distribution of a lecture, small enough to poll while its QR code is live
+@api.route('/api/lectures/<int:lecture_id>/arrivals', methods=['GET'])
+@token_required
+def get_lecture_arrivals(current_user, lecture_id):
+    if current_user['role'] != 'lecturer':
+        return jsonify({"error": "Only lecturers can view arrival statistics"}), 403
+    
+    try:
+        late_after = int(request.args.get('late_after', arrivals.LATE_ARRIVAL_MINUTES))
+    except ValueError:
+        return jsonify({"error": "late_after must be a number of minutes"}), 400
+    if late_after < 0:
+        return jsonify({"error": "late_after must not be negative"}), 400
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({"error": "Database connection failed"}), 500
+    
+    try:
+        if not query_registry.fetch_one(conn, 'lecture_owned_by', (lecture_id, current_user['user_id']), dictionary=False):
+            return jsonify({"error": "Lecture not found or you don't have permission"}), 404
+        
+        rows = query_registry.fetch_all(conn, 'lecture_arrival_buckets', (lecture_id,), dictionary=False)
+        return jsonify(dict(arrivals.summarize(rows, late_after), lecture_id=lecture_id)), 200
+    except Error as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        conn.close()
+
+@api.route('/api/students/attendance', methods=['GET'])
 @token_required
 def get_student_attendance(current_user):
     if current_user['role'] != 'student':
@@ -828,30 +1462,22 @@ def get_student_attendance(current_user):
     if not conn:
         return jsonify({"error": "Database connection failed"}), 500
     
-    cursor = conn.cursor(dictionary=True)
     try:
         # Verify student is enrolled in the course
-        cursor.execute(
-            "SELECT * FROM enrollments WHERE student_id = %s AND course_id = %s",
-            (current_user['user_id'], course_id)
-        )
-        if not cursor.fetchone():
+        if not query_registry.fetch_one(conn, 'enrollment_exists', (current_user['user_id'], course_id), dictionary=False):
             return jsonify({"error": "You are not enrolled in this course"}), 403
         
+        try:
+            scope = resolve_term_scope(conn, request.args.get('term'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        date_filter, date_params = term_date_filter(scope)
+        
         # Get all lectures for the course
-        cursor.execute(
-            """
-            SELECT l.*, 
-                   CASE WHEN a.attendance_id IS NOT NULL THEN 'present' ELSE 'absent' END as status,
-                   a.timestamp as check_in_time
-            FROM lectures l
-            LEFT JOIN attendance a ON l.lecture_id = a.lecture_id AND a.student_id = %s
-            WHERE l.course_id = %s
-            ORDER BY l.date DESC, l.start_time DESC
-            """,
-            (current_user['user_id'], course_id)
+        lectures = query_registry.fetch_all(
+            conn, 'student_lectures', (current_user['user_id'], course_id, *date_params),
+            lectures=scope['lectures'], attendance=scope['attendance'], date_filter=date_filter
         )
-        lectures = cursor.fetchall()
         
         # Calculate attendance statistics
         total_lectures = len(lectures)
@@ -860,6 +1486,7 @@ def get_student_attendance(current_user):
         
         return jsonify({
             "lectures": lectures,
+            "term": term_summary(scope),
             "statistics": {
                 "total_lectures": total_lectures,
                 "attended_lectures": attended_lectures,
@@ -869,13 +1496,266 @@ def get_student_attendance(current_user):
         }), 200
     except Error as e:
         return jsonify({"error": str(e)}), 500
+    finally:
+        conn.close()
+
+# Metrics APIs
+# They expose internal paths and raw database errors, so they are kept off the public API
+def metrics_token_required(f):
+    def decorated(*args, **kwargs):
+        expected = current_app.config['METRICS_TOKEN']
+        if not expected:
+            return jsonify({"error": "Not found"}), 404
+        provided = request.headers.get('X-Metrics-Token', '')
+        if not hmac.compare_digest(provided.encode('utf-8'), expected.encode('utf-8')):
+            return jsonify({"error": "Invalid metrics token"}), 401
+        return f(*args, **kwargs)
+    
+    decorated.__name__ = f.__name__
+    return decorated
+
+@api.route('/api/metrics/check-in-journal', methods=['GET'])
+@metrics_token_required
+def check_in_journal_metrics():
+    check_in_journal = services().check_in_journal
+    if check_in_journal is None:
+        return jsonify({"enabled": False}), 200
+    metrics = check_in_journal.metrics()
+    # The slot is enough to tell workers apart; the absolute path is not needed
+    metrics['directory'] = os.path.basename(metrics['directory'])
+    return jsonify(dict(metrics, enabled=True)), 200
+
+@api.route('/api/metrics/queries', methods=['GET'])
+@metrics_token_required
+def query_metrics():
+    return jsonify({"statements": query_registry.stats()}), 200
+
+@api.route('/api/metrics/admission', methods=['GET'])
+@metrics_token_required
+def admission_metrics():
+    return jsonify({"classes": services().admission_controller.stats()}), 200
+
+# Dashboard bootstrap APIs
+# Everything a dashboard needs on launch in one request, using set-based queries
+# over all of the user's courses instead of one request per course.
+@api.route('/api/bootstrap/student', methods=['GET'])
+@token_required
+def bootstrap_student(current_user):
+    if current_user['role'] != 'student':
+        return jsonify({"error": "Only students can use the student bootstrap"}), 403
+    
+    try:
+        catalog_limit = max(1, min(int(request.args.get('catalog_limit', current_app.config['BOOTSTRAP_CATALOG_PAGE_SIZE'])), 100))
+    except ValueError:
+        return jsonify({"error": "catalog_limit must be an integer"}), 400
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({"error": "Database connection failed"}), 500
+    
+    cursor = conn.cursor(dictionary=True)
+    try:
+        # Enrolled courses with the active QR state of each, from one grouped scan of active QR codes
+        cursor.execute(
+            """
+            SELECT c.*, u.name as lecturer_name,
+                   (aq.course_id IS NOT NULL) as has_active_qr,
+                   aq.qr_remaining_seconds
+            FROM enrollments e
+            JOIN courses c ON c.course_id = e.course_id
+            JOIN users u ON c.lecturer_id = u.user_id
+            LEFT JOIN (
+                SELECT l.course_id, TIMESTAMPDIFF(SECOND, NOW(), MAX(qr.expires_at)) as qr_remaining_seconds
+                FROM qr_codes qr
+                JOIN lectures l ON qr.lecture_id = l.lecture_id
+                JOIN enrollments e2 ON e2.course_id = l.course_id AND e2.student_id = %s
+                WHERE qr.expires_at > NOW()
+                GROUP BY l.course_id
+            ) aq ON aq.course_id = c.course_id
+            WHERE e.student_id = %s
+            ORDER BY c.course_code
+            """,
+            (current_user['user_id'], current_user['user_id'])
+        )
+        courses = cursor.fetchall()
+        
+        # First page of the catalog with the same active QR fields as /api/courses/all;
+        # one extra row tells whether there is a next page
+        cursor.execute(
+            """
+            SELECT c.*, u.name as lecturer_name,
+                   (aq.course_id IS NOT NULL) as has_active_qr,
+                   aq.qr_remaining_seconds
+            FROM courses c
+            JOIN users u ON c.lecturer_id = u.user_id
+            LEFT JOIN (
+                SELECT l.course_id, TIMESTAMPDIFF(SECOND, NOW(), MAX(qr.expires_at)) as qr_remaining_seconds
+                FROM qr_codes qr
+                JOIN lectures l ON qr.lecture_id = l.lecture_id
+                WHERE qr.expires_at > NOW()
+                GROUP BY l.course_id
+            ) aq ON aq.course_id = c.course_id
+            WHERE c.course_id NOT IN (
+                SELECT course_id
+                FROM enrollments
+                WHERE student_id = %s
+            )
+            ORDER BY c.course_code, c.course_id
+            LIMIT %s
+            """,
+            (current_user['user_id'], catalog_limit + 1)
+        )
+        catalog = cursor.fetchall()
+        
+        # Attendance statistics for every enrolled course at once, over the active
+        # term like /api/students/attendance so the two percentages agree
+        scope = resolve_term_scope(conn, None)
+        date_filter, date_params = term_date_filter(scope)
+        cursor.execute(
+            """
+            SELECT l.course_id,
+                   COUNT(*) as total_lectures,
+                   COUNT(a.attendance_id) as attended_lectures
+            FROM enrollments e
+            JOIN lectures l ON l.course_id = e.course_id
+            LEFT JOIN attendance a ON a.lecture_id = l.lecture_id AND a.student_id = e.student_id
+            WHERE e.student_id = %s AND """ + HELD_LECTURE_CONDITION + date_filter + """
+            GROUP BY l.course_id
+            """,
+            (current_user['user_id'], *date_params)
+        )
+        stats_by_course = {row['course_id']: row for row in cursor.fetchall()}
+        
+        statistics = {}
+        for course in courses:
+            row = stats_by_course.get(course['course_id'])
+            total_lectures = row['total_lectures'] if row else 0
+            attended_lectures = row['attended_lectures'] if row else 0
+            attendance_percentage = (attended_lectures / total_lectures * 100) if total_lectures > 0 else 0
+            statistics[course['course_id']] = {
+                "total_lectures": total_lectures,
+                "attended_lectures": attended_lectures,
+                "absent_lectures": total_lectures - attended_lectures,
+                "attendance_percentage": round(attendance_percentage, 2)
+            }
+        
+        return jsonify({
+            "user": {
+                "user_id": current_user['user_id'],
+                "name": current_user['name'],
+                "university_id": current_user['university_id'],
+                "role": current_user['role']
+            },
+            "courses": courses,
+            "catalog": {
+                "courses": catalog[:catalog_limit],
+                "limit": catalog_limit,
+                "has_more": len(catalog) > catalog_limit
+            },
+            "attendance_statistics": statistics,
+            "term": term_summary(scope)
+        }), 200
+    except Error as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+@api.route('/api/bootstrap/lecturer', methods=['GET'])
+@token_required
+def bootstrap_lecturer(current_user):
+    if current_user['role'] != 'lecturer':
+        return jsonify({"error": "Only lecturers can use the lecturer bootstrap"}), 403
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({"error": "Database connection failed"}), 500
+    
+    cursor = conn.cursor(dictionary=True)
+    try:
+        # Courses with student counts and active QR state, each from one grouped scan
+        cursor.execute(
+            """
+            SELECT c.*, u.name as lecturer_name,
+                   COALESCE(sc.student_count, 0) as student_count,
+                   (aq.course_id IS NOT NULL) as has_active_qr,
+                   aq.qr_remaining_seconds
+            FROM courses c
+            JOIN users u ON c.lecturer_id = u.user_id
+            LEFT JOIN (
+                SELECT e.course_id, COUNT(*) as student_count
+                FROM enrollments e
+                JOIN courses c2 ON c2.course_id = e.course_id
+                WHERE c2.lecturer_id = %s
+                GROUP BY e.course_id
+            ) sc ON sc.course_id = c.course_id
+            LEFT JOIN (
+                SELECT l.course_id, TIMESTAMPDIFF(SECOND, NOW(), MAX(qr.expires_at)) as qr_remaining_seconds
+                FROM qr_codes qr
+                JOIN lectures l ON qr.lecture_id = l.lecture_id
+                JOIN courses c3 ON c3.course_id = l.course_id
+                WHERE c3.lecturer_id = %s AND qr.expires_at > NOW()
+                GROUP BY l.course_id
+            ) aq ON aq.course_id = c.course_id
+            WHERE c.lecturer_id = %s
+            ORDER BY c.course_code
+            """,
+            (current_user['user_id'], current_user['user_id'], current_user['user_id'])
+        )
+        courses = cursor.fetchall()
+        
+        # Lectures held and check-ins for every course at once, over the active term
+        # like the course attendance view
+        scope = resolve_term_scope(conn, None)
+        date_filter, date_params = term_date_filter(scope)
+        cursor.execute(
+            """
+            SELECT l.course_id,
+                   COUNT(DISTINCT l.lecture_id) as lectures_held,
+                   COUNT(a.attendance_id) as check_ins
+            FROM courses c
+            JOIN lectures l ON l.course_id = c.course_id
+            LEFT JOIN attendance a ON a.lecture_id = l.lecture_id
+            WHERE c.lecturer_id = %s AND """ + HELD_LECTURE_CONDITION + date_filter + """
+            GROUP BY l.course_id
+            """,
+            (current_user['user_id'], *date_params)
+        )
+        stats_by_course = {row['course_id']: row for row in cursor.fetchall()}
+        
+        statistics = {}
+        for course in courses:
+            row = stats_by_course.get(course['course_id'])
+            lectures_held = row['lectures_held'] if row else 0
+            check_ins = row['check_ins'] if row else 0
+            possible = lectures_held * course['student_count']
+            statistics[course['course_id']] = {
+                "lectures_held": lectures_held,
+                "check_ins": check_ins,
+                "attendance_percentage": round(check_ins / possible * 100, 2) if possible > 0 else 0
+            }
+        
+        return jsonify({
+            "user": {
+                "user_id": current_user['user_id'],
+                "name": current_user['name'],
+                "university_id": current_user['university_id'],
+                "role": current_user['role']
+            },
+            "courses": courses,
+            "attendance_statistics": statistics,
+            "term": term_summary(scope)
+        }), 200
+    except Error as e:
+        return jsonify({"error": str(e)}), 500
     finally:
         cursor.close()
         conn.close()
 
 # Enrollment APIs
-@app.route('/api/enrollments', methods=['POST'])
+@api.route('/api/enrollments', methods=['POST'])
 @token_required
+@idempotent
 def enroll_in_course(current_user):
     if current_user['role'] != 'student':
         return jsonify({"error": "Only students can enroll in courses"}), 403
@@ -894,7 +1774,8 @@ def enroll_in_course(current_user):
     try:
         # Check if course exists
         cursor.execute("SELECT * FROM courses WHERE course_id = %s", (course_id,))
-        if not cursor.fetchone():
+        course = cursor.fetchone()
+        if not course:
             return jsonify({"error": "Course not found"}), 404
         
         # Check if already enrolled
@@ -912,6 +1793,9 @@ def enroll_in_course(current_user):
         )
         conn.commit()
         
+        services().enrollment_cache.set(f"{current_user['user_id']}:{course_id}", True)
+        services().course_list_cache.invalidate(current_user['user_id'], course['lecturer_id'])
+        
         return jsonify({"message": "Enrolled successfully"}), 201
     except Error as e:
         conn.rollback()
@@ -920,5 +1804,260 @@ def enroll_in_course(current_user):
         cursor.close()
         conn.close()
 
+# Term rollover
+# Creates the unsealed term NAME, or moves its dates if it exists and is not sealed yet.
+# Returns its term_id.
+def open_term(cursor, name, start_date, end_date):
+    if end_date < start_date:
+        raise click.UsageError(f"Term {name} cannot end before it starts")
+    
+    cursor.execute("SELECT * FROM terms WHERE name = %s", (name,))
+    term = cursor.fetchone()
+    if term and term['sealed_at']:
+        raise click.ClickException(f"Term {name} was already sealed at {term['sealed_at']}")
+    
+    cursor.execute(
+        "SELECT name FROM terms WHERE name <> %s AND start_date <= %s AND end_date >= %s",
+        (name, end_date, start_date)
+    )
+    overlapping = cursor.fetchone()
+    if overlapping:
+        raise click.ClickException(f"Term {name} would overlap term {overlapping['name']}")
+    
+    if term:
+        cursor.execute(
+            "UPDATE terms SET start_date = %s, end_date = %s WHERE term_id = %s",
+            (start_date, end_date, term['term_id'])
+        )
+        return term['term_id']
+    cursor.execute(
+        "INSERT INTO terms (name, start_date, end_date) VALUES (%s, %s, %s)",
+        (name, start_date, end_date)
+    )
+    return cursor.lastrowid
+
+@api.cli.command('start-term')
+@click.argument('name')
+@click.option('--start', 'start_date', required=True, help="First day of the term (YYYY-MM-DD)")
+@click.option('--end', 'end_date', required=True, help="Last day of the term (YYYY-MM-DD)")
+def start_term(name, start_date, end_date):
+    """Open a term; attendance reports default to the current term once it has started."""
+    start_date = scheduling.parse_date(start_date, 'start')
+    end_date = scheduling.parse_date(end_date, 'end')
+    
+    conn = get_db_connection()
+    if not conn:
+        raise click.ClickException("Database connection failed")
+    
+    cursor = conn.cursor(dictionary=True)
+    try:
+        open_term(cursor, name, start_date, end_date)
+        conn.commit()
+        services().term_cache.invalidate('active')
+        click.echo(f"Opened term {name} from {start_date} to {end_date}")
+    except Error as e:
+        conn.rollback()
+        raise click.ClickException(f"Failed to open term: {e}")
+    finally:
+        cursor.close()
+        conn.close()
+
+# QR codes of a term must have expired at least this long before it is sealed, so
+# check-ins accepted just before expiry have reached the journal
+SEAL_QR_GRACE_SECONDS = 60
+
+@api.cli.command('seal-term')
+@click.argument('name')
+@click.option('--start', 'start_date', help="First day of the term (YYYY-MM-DD); defaults to the opened term's")
+@click.option('--end', 'end_date', help="Last day of the term (YYYY-MM-DD); defaults to the opened term's")
+@click.option('--next', 'next_name', help="Open this term next, starting the day after the sealed one ends")
+@click.option('--next-end', 'next_end_date', help="Last day of the --next term (YYYY-MM-DD)")
+@click.option('--force', is_flag=True, help="Seal even though the term has not ended yet")
+def seal_term(name, start_date, end_date, next_name, next_end_date, force):
+    """Move a finished term's lectures, QR codes, attendance and arrival counts into the archive tables."""
+    if bool(next_name) != bool(next_end_date):
+        raise click.UsageError("--next and --next-end go together")
+    if next_end_date:
+        next_end_date = scheduling.parse_date(next_end_date, 'next-end')
+    
+    conn = get_db_connection()
+    if not conn:
+        raise click.ClickException("Database connection failed")
+    
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT * FROM terms WHERE name = %s", (name,))
+        term = cursor.fetchone()
+        if not term and not (start_date and end_date):
+            raise click.UsageError(f"Term {name} was never opened; pass --start and --end")
+        start_date = scheduling.parse_date(start_date, 'start') if start_date else term['start_date']
+        end_date = scheduling.parse_date(end_date, 'end') if end_date else term['end_date']
+        if end_date >= datetime.date.today() and not force:
+            raise click.UsageError("The term has not ended yet; pass --force to seal it anyway")
+        
+        term_id = open_term(cursor, name, start_date, end_date)
+        
+        term_lectures = "JOIN lectures l ON {alias}.lecture_id = l.lecture_id WHERE l.date BETWEEN %s AND %s"
+        params = (start_date, end_date)
+        
+        # Workers validate check-ins against QR tokens they may have cached, and with
+        # memory:// this process cannot reach their caches. Locking the term's lectures
+        # keeps new QR codes out; refusing while any QR code can still be scanned, or
+        # while check-ins sit in the journal, keeps accepted check-ins from being lost
+        # once their lectures are archived.
+        cursor.execute("SELECT lecture_id FROM lectures WHERE date BETWEEN %s AND %s FOR UPDATE", params)
+        cursor.fetchall()
+        cursor.execute(
+            "SELECT COUNT(*) AS active FROM qr_codes qr " + term_lectures.format(alias='qr')
+            + " AND qr.expires_at > NOW() - INTERVAL %s SECOND",
+            (*params, SEAL_QR_GRACE_SECONDS)
+        )
+        active_qr_codes = cursor.fetchone()['active']
+        if active_qr_codes:
+            raise click.ClickException(
+                f"{active_qr_codes} QR codes of the term are still valid or expired less than "
+                f"{SEAL_QR_GRACE_SECONDS}s ago; seal it once they have expired"
+            )
+        journal_dir = services().check_in_journal_dir
+        pending = pending_records(journal_dir) if journal_dir else 0
+        if pending:
+            raise click.ClickException(
+                f"{pending} journaled check-ins have not been applied yet; seal the term once the workers have applied them"
+            )
+        
+        # Collect what workers may have cached about the lectures being archived
+        cursor.execute("SELECT qr.token FROM qr_codes qr " + term_lectures.format(alias='qr'), params)
+        qr_tokens = [row['token'] for row in cursor.fetchall()]
+        cursor.execute(
+            """
+            SELECT c.lecturer_id AS user_id FROM courses c
+            WHERE c.course_id IN (SELECT course_id FROM lectures WHERE date BETWEEN %s AND %s)
+            UNION
+            SELECT e.student_id FROM enrollments e
+            WHERE e.course_id IN (SELECT course_id FROM lectures WHERE date BETWEEN %s AND %s)
+            """,
+            (*params, *params)
+        )
+        user_ids = [row['user_id'] for row in cursor.fetchall()]
+        
+        # Copy everything into the archive first, children before parents are deleted
+        cursor.execute(
+            "INSERT INTO attendance_archive (term_id, attendance_id, student_id, lecture_id, qr_id, timestamp) "
+            "SELECT %s, a.attendance_id, a.student_id, a.lecture_id, a.qr_id, a.timestamp FROM attendance a "
+            + term_lectures.format(alias='a'),
+            (term_id, *params)
+        )
+        attendance_count = cursor.rowcount
+        cursor.execute(
+            "INSERT INTO arrival_buckets_archive (term_id, lecture_id, qr_id, minute_offset, arrivals) "
+            "SELECT %s, b.lecture_id, b.qr_id, b.minute_offset, b.arrivals FROM arrival_buckets b "
+            + term_lectures.format(alias='b'),
+            (term_id, *params)
+        )
+        cursor.execute(
+            "INSERT INTO qr_codes_archive (term_id, qr_id, lecture_id, token, generated_at, expires_at) "
+            "SELECT %s, qr.qr_id, qr.lecture_id, qr.token, qr.generated_at, qr.expires_at FROM qr_codes qr "
+            + term_lectures.format(alias='qr'),
+            (term_id, *params)
+        )
+        qr_count = cursor.rowcount
+        cursor.execute(
+            f"INSERT INTO lectures_archive (term_id, {LECTURE_COLUMNS}) "
+            f"SELECT %s, {LECTURE_COLUMNS} FROM lectures WHERE date BETWEEN %s AND %s",
+            (term_id, *params)
+        )
+        lecture_count = cursor.rowcount
+        
+        cursor.execute("DELETE a FROM attendance a " + term_lectures.format(alias='a'), params)
+        cursor.execute("DELETE b FROM arrival_buckets b " + term_lectures.format(alias='b'), params)
+        cursor.execute("DELETE qr FROM qr_codes qr " + term_lectures.format(alias='qr'), params)
+        cursor.execute("DELETE FROM lectures WHERE date BETWEEN %s AND %s", params)
+        
+        cursor.execute("UPDATE terms SET sealed_at = NOW() WHERE term_id = %s", (term_id,))
+        if next_name:
+            open_term(cursor, next_name, end_date + datetime.timedelta(days=1), next_end_date)
+        conn.commit()
+        # Only reaches the workers through a shared backend; with memory:// it clears this
+        # process's caches and workers keep theirs until the entries expire
+        app_services = services()
+        app_services.term_cache.invalidate('active')
+        app_services.qr_token_cache.invalidate(*qr_tokens)
+        app_services.course_list_cache.invalidate(*user_ids)
+        
+        click.echo(f"Sealed term {name}: archived {lecture_count} lectures, {qr_count} QR codes "
+                   f"and {attendance_count} attendance records")
+        if not app_services.shared_state_backend.shared:
+            click.echo("SHARED_STATE_URL is not shared between processes: running workers keep the previous "
+                       "active term and course lists until their caches expire (up to 5 minutes)")
+        if next_name:
+            click.echo(f"Opened term {next_name}")
+    except Error as e:
+        conn.rollback()
+        raise click.ClickException(f"Failed to seal term: {e}")
+    finally:
+        cursor.close()
+        conn.close()
+
+@api.cli.command('rebuild-arrivals')
+def rebuild_arrivals():
+    """Recompute arrival_buckets from the attendance table, e.g. for check-ins recorded before it existed."""
+    conn = get_db_connection()
+    if not conn:
+        raise click.ClickException("Database connection failed")
+    
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM arrival_buckets")
+        cursor.execute(
+            f"""
+            INSERT INTO arrival_buckets (lecture_id, qr_id, minute_offset, arrivals)
+            SELECT a.lecture_id, a.qr_id,
+                   LEAST(GREATEST(TIMESTAMPDIFF(MINUTE, qr.generated_at, a.timestamp), 0), {arrivals.MAX_MINUTE_OFFSET}) as minute_offset,
+                   COUNT(*)
+            FROM attendance a
+            JOIN qr_codes qr ON a.qr_id = qr.qr_id
+            GROUP BY a.lecture_id, a.qr_id, minute_offset
+            """
+        )
+        bucket_count = cursor.rowcount
+        conn.commit()
+        click.echo(f"Rebuilt {bucket_count} arrival buckets")
+    except Error as e:
+        conn.rollback()
+        raise click.ClickException(f"Failed to rebuild arrival buckets: {e}")
+    finally:
+        cursor.close()
+        conn.close()
+
+def create_app(config=None):
+    """Application factory; config overrides any of DEFAULT_CONFIG.
+    
+    Used by `flask --app server run` and by WSGI servers as "server:create_app()".
+    Shared-state threads start here, so with a preforking server create the app
+    in each worker (i.e. without preloading it). The check-in journal opens with
+    the first request, under the instance folder unless CHECK_IN_JOURNAL_DIR is
+    absolute.
+    """
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    app.config.update(DEFAULT_CONFIG)
+    if config:
+        app.config.update(config)
+    
+    app_services = app.extensions['attendance'] = Services(app.config)
+    if app.config['CHECK_IN_JOURNAL_DIR']:
+        app_services.check_in_journal_dir = os.path.join(app.instance_path, app.config['CHECK_IN_JOURNAL_DIR'])
+    app.register_blueprint(api)
+    atexit.register(app_services.close)
+    
+    if app.config['DB_POOL_PREWARM']:
+        try:
+            app_services.create_db_pool()
+        except Error as e:
+            # The pool is created again on the first request
+            print(f"Could not pre-warm the database pool: {e}")
+    
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5010)
\ No newline at end of file
+    create_app().run(debug=True, host='0.0.0.0', port=5010)
\ No newline at end of file
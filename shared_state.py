@@ -0,0 +1,762 @@
+"""State shared between worker processes: key/value entries with expiry plus pub/sub.
+
+Three interchangeable backends are selected by URL:
+
+* ``memory://`` - a dict inside the process; only correct with a single worker.
+* ``shm:///path/to/segment`` - a memory-mapped file shared by workers on one host.
+* ``redis://host:port/db`` - any Redis-protocol server. ``python shared_state.py serve``
+  runs a small stand-in server for development and tests.
+
+``SharedCache`` layers a per-worker near cache on top of a backend and keeps it
+coherent by publishing invalidations that every worker applies within milliseconds.
+"""
+import argparse
+import base64
+import datetime
+import decimal
+import fcntl
+import mmap
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import serialization
+
+# Message delivered to subscribers when invalidations may have been missed
+FLUSH = None
+
+# Key marking a JSON object that stands for a value JSON has no type for
+TYPE_TAG = "__type__"
+
+# Report failures of a shared cache at most this often
+ERROR_LOG_INTERVAL = 10.0
+
+
+class MemoryBackend:
+    """Backend kept inside the current process."""
+
+    shared = False
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(list)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires <= time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None, only_if_absent=False):
+        expires = time.time() + ttl if ttl else None
+        with self._lock:
+            if only_if_absent:
+                entry = self._data.get(key)
+                if entry is not None and (entry[1] is None or entry[1] > time.time()):
+                    return False
+            self._data[key] = (value, expires)
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def publish(self, channel, message):
+        for callback in list(self._subscribers[channel]):
+            callback(message)
+
+    def subscribe(self, channel, callback):
+        self._subscribers[channel].append(callback)
+
+    def close(self):
+        pass
+
+
+class SharedMemoryBackend:
+    """Fixed-size hash table and message ring in a memory-mapped file.
+
+    Every worker on the host maps the same file. Writers serialize on an flock
+    of the file; subscribers poll the ring's sequence number.
+    """
+
+    shared = True
+
+    MAGIC = b"ATTSHM01"
+    HEADER = struct.Struct("<8sIIIIQ")  # magic, slots, slot size, ring slots, ring slot size, ring sequence
+    SEQ_OFFSET = 24
+    SLOT_HEADER = struct.Struct("<BdHI")  # state, expires (0 = never), key length, value length
+    RING_HEADER = struct.Struct("<QHH")  # sequence, channel length, message length
+    EMPTY, USED, DELETED = 0, 1, 2
+    MAX_PROBES = 16
+
+    def __init__(self, path, slots=4096, slot_size=4096, ring_slots=1024, ring_slot_size=256,
+                 poll_interval=0.002):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._lock = threading.RLock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size == 0:
+                size = self.HEADER.size + slots * slot_size + ring_slots * ring_slot_size
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, self.HEADER.pack(self.MAGIC, slots, slot_size, ring_slots, ring_slot_size, 0), 0)
+            header = os.pread(self._fd, self.HEADER.size, 0)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+        magic, self.slots, self.slot_size, self.ring_slots, self.ring_slot_size, _ = self.HEADER.unpack(header)
+        if magic != self.MAGIC:
+            raise RuntimeError(f"{path} is not a shared state segment")
+        self._map = mmap.mmap(self._fd, 0)
+        self._ring_offset = self.HEADER.size + self.slots * self.slot_size
+
+        self._subscribers = defaultdict(list)
+        self._poller = None
+        self._closed = threading.Event()
+
+    # The thread lock orders threads of this process, flock orders processes
+    @contextmanager
+    def _locked(self, exclusive):
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _slot_offset(self, index):
+        return self.HEADER.size + index * self.slot_size
+
+    def _read_slot(self, index):
+        offset = self._slot_offset(index)
+        state, expires, key_len, value_len = self.SLOT_HEADER.unpack_from(self._map, offset)
+        key_start = offset + self.SLOT_HEADER.size
+        return state, expires, self._map[key_start:key_start + key_len], key_start + key_len, value_len
+
+    def _probe(self, key):
+        start = zlib.crc32(key) % self.slots
+        return [(start + i) % self.slots for i in range(min(self.MAX_PROBES, self.slots))]
+
+    def get(self, key):
+        key = key.encode("utf-8")
+        now = time.time()
+        with self._locked(exclusive=False):
+            for index in self._probe(key):
+                state, expires, slot_key, value_start, value_len = self._read_slot(index)
+                if state == self.EMPTY:
+                    return None
+                if state == self.USED and slot_key == key:
+                    if expires and expires <= now:
+                        return None
+                    return bytes(self._map[value_start:value_start + value_len])
+        return None
+
+    def set(self, key, value, ttl=None, only_if_absent=False):
+        key = key.encode("utf-8")
+        if self.SLOT_HEADER.size + len(key) + len(value) > self.slot_size:
+            return False
+        now = time.time()
+        expires = now + ttl if ttl else 0.0
+        with self._locked(exclusive=True):
+            target = None
+            for index in self._probe(key):
+                state, slot_expires, slot_key, _, _ = self._read_slot(index)
+                live = state == self.USED and not (slot_expires and slot_expires <= now)
+                if state == self.USED and slot_key == key:
+                    if live and only_if_absent:
+                        return False
+                    target = index
+                    break
+                if not live and target is None:
+                    target = index
+                if state == self.EMPTY:
+                    break
+            if target is None:
+                # Probe window is full of live entries, evict the first one
+                target = self._probe(key)[0]
+
+            offset = self._slot_offset(target)
+            self.SLOT_HEADER.pack_into(self._map, offset, self.USED, expires, len(key), len(value))
+            data_start = offset + self.SLOT_HEADER.size
+            self._map[data_start:data_start + len(key) + len(value)] = key + value
+            return True
+
+    def delete(self, *keys):
+        with self._locked(exclusive=True):
+            for key in keys:
+                key = key.encode("utf-8")
+                for index in self._probe(key):
+                    state, _, slot_key, _, _ = self._read_slot(index)
+                    if state == self.EMPTY:
+                        break
+                    if state == self.USED and slot_key == key:
+                        struct.pack_into("<B", self._map, self._slot_offset(index), self.DELETED)
+                        break
+
+    def _sequence(self):
+        return struct.unpack_from("<Q", self._map, self.SEQ_OFFSET)[0]
+
+    def publish(self, channel, message):
+        channel = channel.encode("utf-8")
+        message = message.encode("utf-8")
+        if self.RING_HEADER.size + len(channel) + len(message) > self.ring_slot_size:
+            # Too large for one ring slot; make subscribers drop everything instead
+            message = b""
+            channel = b""
+        with self._locked(exclusive=True):
+            sequence = self._sequence() + 1
+            offset = self._ring_offset + (sequence % self.ring_slots) * self.ring_slot_size
+            self.RING_HEADER.pack_into(self._map, offset, sequence, len(channel), len(message))
+            data_start = offset + self.RING_HEADER.size
+            self._map[data_start:data_start + len(channel) + len(message)] = channel + message
+            struct.pack_into("<Q", self._map, self.SEQ_OFFSET, sequence)
+
+    def subscribe(self, channel, callback):
+        with self._lock:
+            self._subscribers[channel].append(callback)
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name="shared-state-poller", daemon=True)
+                self._poller.start()
+
+    def _deliver(self, channel, message):
+        if channel is None:
+            targets = [(callback, FLUSH) for callbacks in self._subscribers.values() for callback in callbacks]
+        else:
+            targets = [(callback, message) for callback in self._subscribers.get(channel, [])]
+        for callback, payload in targets:
+            try:
+                callback(payload)
+            except Exception as e:
+                print(f"Shared state subscriber failed: {e}")
+
+    def _poll(self):
+        last_seen = self._sequence()
+        while not self._closed.wait(self.poll_interval):
+            sequence = self._sequence()
+            if sequence == last_seen:
+                continue
+            if sequence - last_seen > self.ring_slots:
+                # The ring wrapped before we read it, so some messages are lost
+                self._deliver(None, FLUSH)
+                last_seen = sequence
+                continue
+            messages = []
+            with self._locked(exclusive=False):
+                for current in range(last_seen + 1, sequence + 1):
+                    offset = self._ring_offset + (current % self.ring_slots) * self.ring_slot_size
+                    stored_sequence, channel_len, message_len = self.RING_HEADER.unpack_from(self._map, offset)
+                    if stored_sequence != current:
+                        messages = None
+                        break
+                    data_start = offset + self.RING_HEADER.size
+                    channel = self._map[data_start:data_start + channel_len].decode("utf-8")
+                    message = self._map[data_start + channel_len:data_start + channel_len + message_len].decode("utf-8")
+                    messages.append((channel, message))
+            last_seen = sequence
+            if messages is None:
+                self._deliver(None, FLUSH)
+                continue
+            for channel, message in messages:
+                self._deliver(channel or None, message)
+
+    def close(self):
+        self._closed.set()
+        self._map.close()
+        os.close(self._fd)
+
+
+class RespError(Exception):
+    pass
+
+
+# Seconds a RespBackend refuses new connection attempts after one failed
+RECONNECT_INTERVAL = 0.5
+
+
+def _encode_command(*args):
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode("utf-8")
+        elif isinstance(arg, (int, float)):
+            arg = str(arg).encode("ascii")
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+def _read_reply(reader):
+    line = reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed by server")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode("utf-8")
+    if kind == b"-":
+        raise RespError(rest.decode("utf-8"))
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        count = int(rest)
+        if count < 0:
+            return None
+        return [_read_reply(reader) for _ in range(count)]
+    raise RespError(f"Unexpected reply: {line!r}")
+
+
+class RespBackend:
+    """Backend on a Redis-protocol server, shared by every worker that connects to it."""
+
+    shared = True
+
+    def __init__(self, host="localhost", port=6379, db=0, password=None, timeout=2.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._local = threading.local()
+        self._subscribers = defaultdict(list)
+        self._subscriber_lock = threading.Lock()
+        self._subscriber_socket = None
+        self._subscriber_thread = None
+        self._closed = threading.Event()
+        self._down_until = 0.0
+
+    def _connect(self, timeout):
+        # Fail fast for a moment after a failed attempt instead of every request
+        # waiting for its own connect timeout while the server is unreachable
+        if time.monotonic() < self._down_until:
+            raise ConnectionError(f"Shared state server {self.host}:{self.port} is unreachable")
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=timeout)
+        except OSError:
+            self._down_until = time.monotonic() + RECONNECT_INTERVAL
+            raise
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        reader = sock.makefile("rb")
+        if self.password:
+            sock.sendall(_encode_command("AUTH", self.password))
+            _read_reply(reader)
+        if self.db:
+            sock.sendall(_encode_command("SELECT", self.db))
+            _read_reply(reader)
+        return sock, reader
+
+    def _command(self, *args):
+        for attempt in range(2):
+            connection = getattr(self._local, "connection", None)
+            try:
+                if connection is None:
+                    connection = self._local.connection = self._connect(self.timeout)
+                sock, reader = connection
+                sock.sendall(_encode_command(*args))
+                return _read_reply(reader)
+            except (ConnectionError, OSError):
+                self._local.connection = None
+                if attempt:
+                    raise
+
+    def get(self, key):
+        return self._command("GET", key)
+
+    def set(self, key, value, ttl=None, only_if_absent=False):
+        args = ["SET", key, value]
+        if ttl:
+            args += ["PX", int(ttl * 1000)]
+        if only_if_absent:
+            args.append("NX")
+        return self._command(*args) is not None
+
+    def delete(self, *keys):
+        if keys:
+            self._command("DEL", *keys)
+
+    def publish(self, channel, message):
+        self._command("PUBLISH", channel, message)
+
+    def subscribe(self, channel, callback):
+        with self._subscriber_lock:
+            new_channel = channel not in self._subscribers
+            self._subscribers[channel].append(callback)
+            if self._subscriber_thread is None:
+                self._subscriber_thread = threading.Thread(target=self._listen, name="shared-state-subscriber", daemon=True)
+                self._subscriber_thread.start()
+            elif new_channel and self._subscriber_socket is not None:
+                self._subscriber_socket.sendall(_encode_command("SUBSCRIBE", channel))
+
+    def _deliver(self, channel, message):
+        if channel is None:
+            targets = [(callback, FLUSH) for callbacks in self._subscribers.values() for callback in callbacks]
+        else:
+            targets = [(callback, message) for callback in self._subscribers.get(channel, [])]
+        for callback, payload in targets:
+            try:
+                callback(payload)
+            except Exception as e:
+                print(f"Shared state subscriber failed: {e}")
+
+    def _listen(self):
+        while not self._closed.is_set():
+            try:
+                sock, reader = self._connect(timeout=None)
+                with self._subscriber_lock:
+                    self._subscriber_socket = sock
+                    channels = list(self._subscribers)
+                sock.sendall(_encode_command("SUBSCRIBE", *channels))
+                # Anything published while we were disconnected is lost
+                self._deliver(None, FLUSH)
+                while True:
+                    reply = _read_reply(reader)
+                    if isinstance(reply, list) and reply and reply[0] == b"message":
+                        self._deliver(reply[1].decode("utf-8"), reply[2].decode("utf-8"))
+            except (ConnectionError, OSError, RespError) as e:
+                if self._closed.is_set():
+                    return
+                print(f"Shared state subscriber disconnected: {e}")
+                with self._subscriber_lock:
+                    self._subscriber_socket = None
+                # Invalidations are missed until we are back, so stop trusting near caches
+                self._deliver(None, FLUSH)
+                self._closed.wait(0.5)
+
+    def close(self):
+        self._closed.set()
+        with self._subscriber_lock:
+            if self._subscriber_socket is not None:
+                self._subscriber_socket.close()
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection[0].close()
+
+
+def create_backend(url):
+    """Build a backend from a URL such as memory://, shm:///tmp/segment or redis://host:6379/0."""
+    parts = urlsplit(url)
+    if parts.scheme == "memory":
+        return MemoryBackend()
+    if parts.scheme == "shm":
+        if not parts.path:
+            raise ValueError("shm:// URLs need a file path, e.g. shm:///tmp/attendance_shared_state")
+        return SharedMemoryBackend(parts.path)
+    if parts.scheme == "redis":
+        db = int(parts.path.lstrip("/") or 0)
+        return RespBackend(parts.hostname or "localhost", parts.port or 6379, db, parts.password)
+    raise ValueError(f"Unsupported shared state URL: {url}")
+
+
+def _tag(value):
+    if isinstance(value, dict):
+        return {key: _tag(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_tag(item) for item in value]
+    if isinstance(value, datetime.datetime):
+        return {TYPE_TAG: "datetime", "value": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {TYPE_TAG: "date", "value": value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {TYPE_TAG: "time", "value": value.isoformat()}
+    if isinstance(value, datetime.timedelta):
+        return {TYPE_TAG: "timedelta", "value": value.total_seconds()}
+    if isinstance(value, decimal.Decimal):
+        return {TYPE_TAG: "decimal", "value": str(value)}
+    if isinstance(value, (bytes, bytearray)):
+        return {TYPE_TAG: "bytes", "value": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, tuple):
+        return {TYPE_TAG: "tuple", "value": [_tag(item) for item in value]}
+    return value
+
+
+_UNTAG = {
+    "datetime": datetime.datetime.fromisoformat,
+    "date": datetime.date.fromisoformat,
+    "time": datetime.time.fromisoformat,
+    "timedelta": lambda seconds: datetime.timedelta(seconds=seconds),
+    "decimal": decimal.Decimal,
+    "bytes": base64.b64decode,
+    "tuple": lambda items: tuple(_untag(item) for item in items)
+}
+
+
+def _untag(value):
+    if isinstance(value, dict):
+        kind = value.get(TYPE_TAG)
+        if kind is not None:
+            return _UNTAG[kind](value["value"])
+        return {key: _untag(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_untag(item) for item in value]
+    return value
+
+
+def encode_value(value):
+    """Serialize a cached value (database rows and plain containers) as tagged JSON.
+
+    Unlike pickle, decoding cannot run code, so a writable shared server is not a
+    way into every worker.
+    """
+    return serialization.dumps(_tag(value))
+
+
+def decode_value(raw):
+    return _untag(serialization.loads(raw))
+
+
+class SharedCache:
+    """Namespaced cache on a shared backend with a per-worker near cache.
+
+    Values are stored as tagged JSON (see encode_value). When the backend is
+    shared across processes, each worker also keeps recently read values
+    locally and drops them as soon as another worker publishes an
+    invalidation for the key.
+
+    The cache fails open: when the backend is unreachable or refuses a value,
+    the error is logged and reads behave as misses, so callers fall through to
+    the database.
+    """
+
+    def __init__(self, backend, namespace, ttl, local_max_entries=10000):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+        self.channel = f"invalidate:{namespace}"
+        self.local_max_entries = local_max_entries
+        self._local = OrderedDict()
+        self._local_lock = threading.Lock()
+        self._generation = 0
+        self._last_error_report = 0.0
+        if backend.shared:
+            backend.subscribe(self.channel, self._on_invalidate)
+
+    def _report(self, action, error):
+        now = time.monotonic()
+        if now - self._last_error_report >= ERROR_LOG_INTERVAL:
+            self._last_error_report = now
+            print(f"Shared cache {self.namespace}: {action} failed, falling back to the database: {error!r}")
+
+    def _key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def _on_invalidate(self, message):
+        with self._local_lock:
+            self._generation += 1
+            if message is FLUSH:
+                self._local.clear()
+                return
+            for key in message.split("\n"):
+                self._local.pop(key, None)
+
+    def get(self, key):
+        key = str(key)
+        if self.backend.shared:
+            with self._local_lock:
+                entry = self._local.get(key)
+                if entry is not None and entry[1] > time.monotonic():
+                    return entry[0]
+                generation = self._generation
+
+        try:
+            raw = self.backend.get(self._key(key))
+            if raw is None:
+                return None
+            value = decode_value(raw)
+        except Exception as e:
+            self._report("get", e)
+            return None
+
+        if self.backend.shared:
+            with self._local_lock:
+                # Skip the near cache if an invalidation arrived while we were reading
+                if generation == self._generation:
+                    self._local[key] = (value, time.monotonic() + self.ttl)
+                    while len(self._local) > self.local_max_entries:
+                        self._local.popitem(last=False)
+        return value
+
+    def set(self, key, value, ttl=None):
+        key = str(key)
+        ttl = ttl or self.ttl
+        try:
+            if not self.backend.set(self._key(key), encode_value(value), ttl):
+                # Refused (e.g. larger than a shm slot); never leave the old value readable
+                self.backend.delete(self._key(key))
+        except Exception as e:
+            self._report("set", e)
+        if self.backend.shared:
+            with self._local_lock:
+                self._generation += 1
+                self._local.pop(key, None)
+            try:
+                self.backend.publish(self.channel, key)
+            except Exception as e:
+                self._report("publish", e)
+
+    def invalidate(self, *keys):
+        keys = [str(key) for key in keys]
+        if not keys:
+            return
+        try:
+            self.backend.delete(*[self._key(key) for key in keys])
+        except Exception as e:
+            self._report("invalidate", e)
+        if self.backend.shared:
+            with self._local_lock:
+                self._generation += 1
+                for key in keys:
+                    self._local.pop(key, None)
+            try:
+                self.backend.publish(self.channel, "\n".join(keys))
+            except Exception as e:
+                self._report("publish", e)
+
+
+class _StandInStore:
+    def __init__(self):
+        self.data = {}
+        self.channels = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= time.time():
+            del self.data[key]
+            return None
+        return value
+
+
+class _StandInHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.write_lock = threading.Lock()
+        self.subscriptions = set()
+
+    def send(self, data):
+        with self.write_lock:
+            self.wfile.write(data)
+            self.wfile.flush()
+
+    def handle(self):
+        store = self.server.store
+        try:
+            while True:
+                command = _read_reply(self.rfile)
+                if not isinstance(command, list) or not command:
+                    self.send(b"-ERR protocol error\r\n")
+                    return
+                name = command[0].decode("utf-8").upper()
+                args = command[1:]
+                self.send(self.execute(store, name, args))
+                if name == "QUIT":
+                    return
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with store.lock:
+                for channel in self.subscriptions:
+                    store.channels[channel].discard(self)
+
+    def execute(self, store, name, args):
+        if name in ("PING", "QUIT", "SELECT", "AUTH"):
+            return b"+PONG\r\n" if name == "PING" else b"+OK\r\n"
+        if name == "GET":
+            with store.lock:
+                value = store.get(args[0])
+            return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+        if name == "SET":
+            key, value, expires, only_if_absent = args[0], args[1], None, False
+            options = [arg.decode("utf-8").upper() for arg in args[2:]]
+            for i, option in enumerate(options):
+                if option == "EX":
+                    expires = time.time() + int(options[i + 1])
+                elif option == "PX":
+                    expires = time.time() + int(options[i + 1]) / 1000
+                elif option == "NX":
+                    only_if_absent = True
+            with store.lock:
+                if only_if_absent and store.get(key) is not None:
+                    return b"$-1\r\n"
+                store.data[key] = (value, expires)
+            return b"+OK\r\n"
+        if name == "DEL":
+            with store.lock:
+                removed = sum(1 for key in args if store.data.pop(key, None) is not None)
+            return b":%d\r\n" % removed
+        if name == "PUBLISH":
+            channel, message = args
+            with store.lock:
+                receivers = list(store.channels.get(channel, ()))
+            payload = _encode_command("message", channel, message)
+            for receiver in receivers:
+                try:
+                    receiver.send(payload)
+                except OSError:
+                    pass
+            return b":%d\r\n" % len(receivers)
+        if name == "SUBSCRIBE":
+            replies = []
+            with store.lock:
+                for channel in args:
+                    store.channels[channel].add(self)
+                    self.subscriptions.add(channel)
+                    replies.append(_encode_command("subscribe", channel)
+                                   .replace(b"*2\r\n", b"*3\r\n", 1)
+                                   + b":%d\r\n" % len(self.subscriptions))
+            return b"".join(replies)
+        return b"-ERR unknown command '%s'\r\n" % name.encode("utf-8")
+
+
+class StandInServer(socketserver.ThreadingTCPServer):
+    """Minimal Redis-protocol server covering the commands RespBackend uses."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, _StandInHandler)
+        self.store = _StandInStore()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared state utilities")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    serve = subcommands.add_parser("serve", help="run a local Redis-protocol stand-in server")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        server = StandInServer((args.host, args.port))
+        print(f"Shared state stand-in listening on {args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+
+if __name__ == "__main__":
+    main()
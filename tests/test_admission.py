@@ -0,0 +1,63 @@
+import pytest
+
+import server
+from admission import AdmissionController, Rejected
+
+
+def controller(**limits):
+    return AdmissionController({"auth": dict({"concurrency": 4, "queue": 4, "max_wait": 1.0}, **limits)},
+                               {"login": "auth"})
+
+
+def admit_many(admission, count, key, address):
+    for _ in range(count):
+        admission.release(admission.admit("api.login", key, address))
+
+
+def test_user_bucket_refuses_once_drained():
+    admission = controller(rate=0.001, burst=3)
+    admit_many(admission, 3, "account:1", "10.0.0.1")
+    with pytest.raises(Rejected) as excinfo:
+        admission.admit("api.login", "account:1", "10.0.0.1")
+    assert excinfo.value.status == 429
+    # Another account behind the same address keeps its own bucket
+    admit_many(admission, 3, "account:2", "10.0.0.1")
+
+
+def test_fresh_keys_from_one_address_hit_the_address_bucket():
+    admission = controller(rate=0.001, burst=1, address_rate=0.001, address_burst=5)
+    for n in range(5):
+        admit_many(admission, 1, f"account:{n}", "10.0.0.1")
+    with pytest.raises(Rejected):
+        admission.admit("api.login", "account:new", "10.0.0.1")
+    admit_many(admission, 1, "account:new", "10.0.0.2")
+
+
+def test_refusal_does_not_spend_the_other_bucket():
+    admission = controller(rate=0.001, burst=1, address_rate=0.001, address_burst=2)
+    admit_many(admission, 1, "account:1", "10.0.0.1")
+    with pytest.raises(Rejected):
+        admission.admit("api.login", "account:1", "10.0.0.1")
+    admit_many(admission, 1, "account:2", "10.0.0.1")
+    assert admission.stats()["auth"]["tracked_addresses"] == 1
+
+
+@pytest.fixture
+def client():
+    return server.create_app({"CHECK_IN_JOURNAL_DIR": None, "DATABASE": {"host": "127.0.0.1", "port": 1}}).test_client()
+
+
+def login(client, university_id, address, authorization=None):
+    headers = {"Authorization": authorization} if authorization else {}
+    return client.post("/api/login", json={"university_id": university_id, "password": "x"},
+                       headers=headers, environ_base={"REMOTE_ADDR": address}).status_code
+
+
+def test_rotating_authorization_headers_share_one_bucket(client):
+    codes = [login(client, "s1", "10.0.0.1", f"junk{n}") for n in range(8)]
+    assert codes.count(429) == 3
+
+
+def test_failed_logins_from_elsewhere_do_not_lock_out_the_account(client):
+    assert 429 in [login(client, "s1", "10.0.0.66") for _ in range(8)]
+    assert login(client, "s1", "10.0.0.1") != 429
@@ -0,0 +1,81 @@
+import os
+import time
+
+import server
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_apps_do_not_share_services(tmp_path):
+    first = server.create_app({"CHECK_IN_JOURNAL_DIR": str(tmp_path / "first"), "DATABASE": {"host": "db-1"}})
+    second = server.create_app({"CHECK_IN_JOURNAL_DIR": str(tmp_path / "second"), "DATABASE": {"host": "db-2"}})
+    first_services = first.extensions["attendance"]
+    second_services = second.extensions["attendance"]
+    try:
+        assert first_services.db_config == {"host": "db-1"}
+        assert first_services.user_cache is not second_services.user_cache
+        first.test_client().get("/")
+        second.test_client().get("/")
+        # Creating the second app leaves the first one's journal running
+        first_services.check_in_journal.append({"student_id": 1})
+        with first.app_context():
+            assert server.services() is first_services
+    finally:
+        first_services.close()
+        second_services.close()
+
+
+def test_journal_applier_runs_in_its_own_app(tmp_path, monkeypatch):
+    seen = []
+    monkeypatch.setattr(server, "apply_journaled_check_ins", lambda records: seen.append(server.services()))
+    app = server.create_app({"CHECK_IN_JOURNAL_DIR": str(tmp_path)})
+    other = server.create_app({"CHECK_IN_JOURNAL_DIR": None})
+    try:
+        app.test_client().get("/")
+        app.extensions["attendance"].check_in_journal.append({"student_id": 1})
+        assert wait_for(lambda: seen)
+        assert seen[0] is app.extensions["attendance"]
+    finally:
+        app.extensions["attendance"].close()
+        other.extensions["attendance"].close()
+
+
+def test_journal_opens_with_the_first_request(tmp_path):
+    app = server.create_app({"CHECK_IN_JOURNAL_DIR": str(tmp_path)})
+    app_services = app.extensions["attendance"]
+    try:
+        # CLI commands build the app too but never serve a request
+        app.test_cli_runner().invoke(args=["start-term"])
+        assert app_services.check_in_journal is None
+        assert os.listdir(tmp_path) == []
+        app.test_client().get("/")
+        assert app_services.check_in_journal is not None
+    finally:
+        app_services.close()
+
+
+def test_relative_journal_directory_is_inside_the_instance_folder():
+    app = server.create_app()
+    try:
+        assert app.extensions["attendance"].check_in_journal_dir == os.path.join(app.instance_path, "checkin_journal")
+    finally:
+        app.extensions["attendance"].close()
+
+
+def test_unwritable_journal_directory_falls_back_to_direct_inserts(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    app = server.create_app({"CHECK_IN_JOURNAL_DIR": str(blocker / "journal")})
+    try:
+        assert app.test_client().get("/").status_code == 404
+        assert app.extensions["attendance"].check_in_journal is None
+        assert app.extensions["attendance"].check_in_journal_dir is None
+    finally:
+        app.extensions["attendance"].close()
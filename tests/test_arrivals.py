@@ -0,0 +1,64 @@
+import datetime
+
+from arrivals import MAX_MINUTE_OFFSET, count_buckets, minute_offset, summarize, summarize_histogram
+
+GENERATED = datetime.datetime(2026, 3, 2, 9, 0)
+
+
+def test_minute_offset_is_whole_minutes_and_clamped():
+    assert minute_offset(GENERATED, "2026-03-02 09:00:59") == 0
+    assert minute_offset(GENERATED, "2026-03-02 09:01:00") == 1
+    assert minute_offset("2026-03-02 09:00:00", GENERATED - datetime.timedelta(seconds=5)) == 0
+    assert minute_offset(GENERATED, GENERATED + datetime.timedelta(days=3)) == MAX_MINUTE_OFFSET
+
+
+def test_count_buckets_groups_by_lecture_qr_and_minute():
+    records = [
+        {"lecture_id": 1, "qr_id": 10, "timestamp": "2026-03-02 09:00:30"},
+        {"lecture_id": 1, "qr_id": 10, "timestamp": "2026-03-02 09:00:45"},
+        {"lecture_id": 1, "qr_id": 10, "timestamp": "2026-03-02 09:03:00"},
+        {"lecture_id": 2, "qr_id": 11, "timestamp": "2026-03-02 09:00:10"},
+        # QR codes that are gone are skipped
+        {"lecture_id": 3, "qr_id": 99, "timestamp": "2026-03-02 09:00:10"},
+    ]
+    assert count_buckets(records, {10: GENERATED, 11: "2026-03-02 09:00:00"}) == {
+        (1, 10, 0): 2,
+        (1, 10, 3): 1,
+        (2, 11, 0): 1
+    }
+
+
+def test_summarize_histogram():
+    histogram = [5, 3, 1, 0, 0, 0, 0, 0, 0, 0, 1]
+    assert summarize_histogram(histogram) == {"arrivals": 10, "late": 1, "minutes_to_90_percent": 3}
+    assert summarize_histogram([]) == {"arrivals": 0, "late": 0, "minutes_to_90_percent": None}
+
+
+def test_summarize_combines_windows_aligned_on_generation():
+    first = GENERATED
+    second = GENERATED + datetime.timedelta(minutes=30)
+    rows = [
+        (2, second, None, 1, 4),
+        (1, first, None, 0, 2),
+        (1, first, None, 2, 1),
+    ]
+    result = summarize(rows, late_after=2)
+    assert result["histogram"] == [2, 4, 1]
+    assert result["arrivals"] == 7
+    assert result["late"] == 1
+    assert result["late_after_minutes"] == 2
+    assert [window["qr_id"] for window in result["windows"]] == [1, 2]
+    assert result["windows"][0]["histogram"] == [2, 0, 1]
+    assert result["windows"][1]["histogram"] == [0, 4]
+    assert result["windows"][1]["minutes_to_90_percent"] == 2
+
+
+def test_summarize_without_rows():
+    assert summarize([]) == {
+        "arrivals": 0,
+        "late": 0,
+        "minutes_to_90_percent": None,
+        "late_after_minutes": 10,
+        "histogram": [],
+        "windows": []
+    }
@@ -0,0 +1,191 @@
+import os
+import threading
+import time
+
+import checkin_journal
+from checkin_journal import CheckInJournal
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+class Recorder:
+    """apply_batch stand-in that records batches and fails while told to."""
+
+    def __init__(self, failing=False, fail_after=None):
+        self.records = []
+        self.calls = 0
+        self.failing = failing
+        self.fail_after = fail_after
+        self.lock = threading.Lock()
+
+    def __call__(self, records):
+        with self.lock:
+            self.calls += 1
+            if self.failing or (self.fail_after is not None and self.calls > self.fail_after):
+                raise RuntimeError("database unavailable")
+            self.records.extend(records)
+
+
+def open_journal(root, apply_batch, **kwargs):
+    kwargs.setdefault("apply_interval", 0.01)
+    kwargs.setdefault("max_retry_interval", 0.2)
+    return CheckInJournal(str(root), apply_batch, **kwargs)
+
+
+def check_in(n):
+    return {"student_id": n, "lecture_id": 1, "qr_id": 1, "timestamp": "2026-10-19 09:00:00"}
+
+
+def segment_paths(directory):
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if name.startswith(checkin_journal.SEGMENT_PREFIX)]
+
+
+def test_appended_check_ins_are_applied(tmp_path):
+    recorder = Recorder()
+    journal = open_journal(tmp_path, recorder)
+    try:
+        for n in range(10):
+            journal.append(check_in(n))
+        assert wait_for(lambda: len(recorder.records) == 10)
+        assert recorder.records == [check_in(n) for n in range(10)]
+        assert wait_for(lambda: journal.metrics()["pending_records"] == 0)
+    finally:
+        journal.close()
+
+
+def test_torn_tail_is_truncated_on_recovery(tmp_path):
+    journal = open_journal(tmp_path, Recorder(failing=True))
+    for n in range(3):
+        journal.append(check_in(n))
+    directory = journal.directory
+    journal.close()
+
+    # A crash in the middle of a write leaves a partial record behind
+    segment = segment_paths(directory)[-1]
+    intact_size = os.path.getsize(segment)
+    with open(segment, "ab") as f:
+        f.write(checkin_journal.RECORD_HEADER.pack(100, 0) + b'{"student_id":')
+
+    recorder = Recorder()
+    journal = open_journal(tmp_path, recorder)
+    try:
+        assert journal.directory == directory
+        assert os.path.getsize(segment) == intact_size
+        assert journal.replayed_on_start == 3
+        assert wait_for(lambda: len(recorder.records) == 3)
+        # New appends go after the truncated tail and are read back intact
+        journal.append(check_in(3))
+        assert wait_for(lambda: len(recorder.records) == 4)
+        assert recorder.records == [check_in(n) for n in range(4)]
+    finally:
+        journal.close()
+
+
+def test_replay_after_crash_resumes_from_checkpoint(tmp_path):
+    journal = open_journal(tmp_path, Recorder(failing=True))
+    for n in range(5):
+        journal.append(check_in(n))
+    journal.close()
+
+    # The first batch reaches the database, then it goes away again
+    partial = Recorder(fail_after=1)
+    journal = open_journal(tmp_path, partial, batch_size=2)
+    assert wait_for(lambda: partial.calls >= 2)
+    journal.close()
+    assert partial.records == [check_in(0), check_in(1)]
+
+    recorder = Recorder()
+    journal = open_journal(tmp_path, recorder)
+    try:
+        assert journal.replayed_on_start == 3
+        assert wait_for(lambda: len(recorder.records) == 3)
+        assert recorder.records == [check_in(n) for n in range(2, 5)]
+    finally:
+        journal.close()
+
+
+def test_abandoned_slot_is_taken_over(tmp_path):
+    first = open_journal(tmp_path, Recorder(failing=True))
+    second = open_journal(tmp_path, Recorder(failing=True))
+    for n in range(3):
+        first.append(check_in(n))
+    for n in range(3, 7):
+        second.append(check_in(n))
+    abandoned = second.directory
+    first.close()
+    second.close()
+
+    # Only one worker comes back; it takes the first slot and drains the other
+    recorder = Recorder()
+    journal = open_journal(tmp_path, recorder, batch_size=3)
+    try:
+        assert journal.directory != abandoned
+        assert wait_for(lambda: len(recorder.records) == 7)
+        assert sorted(record["student_id"] for record in recorder.records) == list(range(7))
+        assert segment_paths(abandoned) == []
+        assert journal.metrics()["adopted_from_abandoned_slots"] == 4
+    finally:
+        journal.close()
+
+
+def test_slot_of_a_running_worker_is_left_alone(tmp_path):
+    running = open_journal(tmp_path, Recorder(failing=True), max_retry_interval=5.0)
+    running.append(check_in(1))
+
+    recorder = Recorder()
+    journal = open_journal(tmp_path, recorder)
+    try:
+        time.sleep(0.2)
+        assert recorder.records == []
+        assert segment_paths(running.directory)
+    finally:
+        journal.close()
+        running.close()
+
+
+def test_backoff_is_not_cut_short_by_appends(tmp_path):
+    recorder = Recorder(failing=True)
+    journal = open_journal(tmp_path, recorder, apply_interval=0.05, max_retry_interval=1.0)
+    try:
+        deadline = time.monotonic() + 0.6
+        appends = 0
+        while time.monotonic() < deadline:
+            journal.append(check_in(appends))
+            appends += 1
+            time.sleep(0.005)
+        # Backoff 0.05, 0.1, 0.2, 0.4: a handful of attempts, not one per append
+        assert appends > 20
+        assert recorder.calls <= 6
+    finally:
+        journal.close()
+
+
+def test_pending_records_counts_every_slot(tmp_path):
+    assert checkin_journal.pending_records(str(tmp_path / "missing")) == 0
+    failing = Recorder(failing=True)
+    first = open_journal(tmp_path, failing)
+    second = open_journal(tmp_path, failing)
+    try:
+        for n in range(3):
+            first.append(check_in(n))
+        second.append(check_in(3))
+        assert checkin_journal.pending_records(str(tmp_path)) == 4
+    finally:
+        first.close(timeout=0.1)
+        second.close(timeout=0.1)
+
+    recorder = Recorder()
+    journal = open_journal(tmp_path, recorder)
+    try:
+        assert wait_for(lambda: len(recorder.records) == 4)
+        assert wait_for(lambda: checkin_journal.pending_records(str(tmp_path)) == 0)
+    finally:
+        journal.close()
@@ -0,0 +1,98 @@
+import itertools
+
+import pytest
+from flask import jsonify
+
+import idempotency
+import server
+from idempotency import DONE, MISMATCH, NEW, PENDING, MemoryResponseStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(idempotency.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_reserve_complete_replay():
+    store = MemoryResponseStore(ttl_seconds=60, max_entries=10)
+    assert store.reserve("k", "body") == (NEW, None)
+    assert store.reserve("k", "body") == (PENDING, None)
+    assert store.reserve("k", "other body") == (MISMATCH, None)
+    store.complete("k", {"status": 201})
+    assert store.reserve("k", "body") == (DONE, {"status": 201})
+
+
+def test_release_lets_the_key_run_again():
+    store = MemoryResponseStore(ttl_seconds=60, max_entries=10)
+    store.reserve("k", "body")
+    store.release("k")
+    assert store.reserve("k", "body") == (NEW, None)
+
+
+def test_pending_reservations_expire_behind_completed_entries(clock):
+    store = MemoryResponseStore(ttl_seconds=24 * 3600, max_entries=100)
+    store.reserve("done", "body")
+    store.complete("done", {"status": 201})
+    for n in range(5):
+        store.reserve(f"abandoned-{n}", "body")
+
+    clock[0] += idempotency.PENDING_TTL_SECONDS + 1
+    store.reserve("fresh", "body")
+    # The abandoned reservations are gone even though an older, still valid response was kept
+    assert len(store) == 2
+    assert store.reserve("done", "body") == (DONE, {"status": 201})
+
+
+def test_completed_responses_expire(clock):
+    store = MemoryResponseStore(ttl_seconds=10, max_entries=10)
+    store.reserve("k", "body")
+    store.complete("k", {"status": 201})
+    clock[0] += 11
+    assert store.reserve("k", "body") == (NEW, None)
+
+
+def test_eviction_drops_old_responses_before_pending_reservations():
+    store = MemoryResponseStore(ttl_seconds=60, max_entries=2)
+    store.reserve("done", "body")
+    store.complete("done", {"status": 201})
+    store.reserve("pending", "body")
+    store.reserve("new", "body")
+    assert len(store) == 2
+    assert store.reserve("pending", "body") == (PENDING, None)
+    assert store.reserve("done", "body") == (NEW, None)
+
+
+@pytest.fixture
+def app():
+    app = server.create_app({"CHECK_IN_JOURNAL_DIR": None})
+    calls = itertools.count(1)
+
+    @server.idempotent
+    def handler(current_user):
+        return jsonify({"call": next(calls)}), 201
+
+    app.add_url_rule("/test/write", "write", lambda: handler({"user_id": 1}), methods=["POST"])
+    return app
+
+
+def test_idempotent_replays_the_stored_response(app):
+    client = app.test_client()
+    first = client.post("/test/write", json={"a": 1}, headers={"Idempotency-Key": "abc"})
+    second = client.post("/test/write", json={"a": 1}, headers={"Idempotency-Key": "abc"})
+    assert first.status_code == second.status_code == 201
+    assert first.get_json() == second.get_json() == {"call": 1}
+    assert second.headers["Idempotent-Replayed"] == "true"
+
+
+def test_idempotent_rejects_a_reused_key_with_another_body(app):
+    client = app.test_client()
+    client.post("/test/write", json={"a": 1}, headers={"Idempotency-Key": "abc"})
+    assert client.post("/test/write", json={"a": 2}, headers={"Idempotency-Key": "abc"}).status_code == 422
+
+
+def test_requests_without_a_key_always_run(app):
+    client = app.test_client()
+    assert client.post("/test/write", json={}).get_json() == {"call": 1}
+    assert client.post("/test/write", json={}).get_json() == {"call": 2}
@@ -0,0 +1,95 @@
+import datetime
+
+import pytest
+
+import scheduling
+from scheduling import expand_rule, parse_rule, parse_weekday
+
+D = datetime.date
+T = datetime.time
+
+
+def rule(**overrides):
+    body = {
+        "term_start": "2026-03-02",
+        "term_end": "2026-03-29",
+        "slots": [{"weekday": "mon", "start_time": "09:00", "end_time": "10:30"}]
+    }
+    body.update(overrides)
+    return parse_rule(body)
+
+
+def dates(parsed):
+    return [day for day, _, _ in expand_rule(parsed)]
+
+
+def test_weekly_slot_expands_to_every_week():
+    assert expand_rule(rule()) == [
+        (D(2026, 3, day), T(9, 0), T(10, 30)) for day in (2, 9, 16, 23)
+    ]
+
+
+def test_first_occurrence_is_the_first_matching_weekday():
+    parsed = rule(slots=[{"weekday": 4, "start_time": "14:00", "end_time": "15:00"}])
+    assert dates(parsed) == [D(2026, 3, 6), D(2026, 3, 13), D(2026, 3, 20), D(2026, 3, 27)]
+
+
+def test_exclusions():
+    parsed = rule(exclude_dates=["2026-03-09"],
+                  exclude_ranges=[{"start": "2026-03-20", "end": "2026-04-30"}])
+    assert dates(parsed) == [D(2026, 3, 2), D(2026, 3, 16)]
+
+
+def test_duplicate_slots_give_one_lecture():
+    slot = {"weekday": "monday", "start_time": "09:00", "end_time": "10:30"}
+    assert len(expand_rule(rule(slots=[slot, slot]))) == 4
+
+
+def test_huge_exclusion_range_is_not_expanded():
+    parsed = rule(exclude_ranges=[{"start": "0001-01-01", "end": "9999-12-31"}])
+    assert parsed["excluded_ranges"] == [(D(1, 1, 1), D(9999, 12, 31))]
+    assert dates(parsed) == []
+
+
+def test_term_length_is_bounded():
+    with pytest.raises(ValueError):
+        rule(term_start="0001-01-01", term_end="9999-12-31")
+
+
+def test_term_at_the_end_of_the_calendar():
+    parsed = rule(term_start="9999-12-01", term_end="9999-12-31",
+                  slots=[{"weekday": "fri", "start_time": "09:00", "end_time": "10:00"}])
+    assert dates(parsed) == [D(9999, 12, 3), D(9999, 12, 10), D(9999, 12, 17), D(9999, 12, 24), D(9999, 12, 31)]
+    # No matching weekday before the last representable date
+    parsed = rule(term_start="9999-12-31", term_end="9999-12-31")
+    assert dates(parsed) == []
+
+
+def test_occurrence_limit(monkeypatch):
+    monkeypatch.setattr(scheduling, "MAX_OCCURRENCES", 3)
+    with pytest.raises(ValueError):
+        expand_rule(rule())
+
+
+@pytest.mark.parametrize("body, message", [
+    ({"term_end": "2026-03-01"}, "term_end"),
+    ({"term_start": "03/02/2026"}, "term_start"),
+    ({"slots": []}, "slot"),
+    ({"slots": [{"weekday": "mon", "start_time": "10:00", "end_time": "09:00"}]}, "end_time"),
+    ({"exclude_ranges": [{"start": "2026-03-10", "end": "2026-03-09"}]}, "Excluded range"),
+    ({"exclude_ranges": ["2026-03-10"]}, "excluded range"),
+])
+def test_invalid_rules(body, message):
+    with pytest.raises(ValueError, match=message):
+        rule(**body)
+
+
+@pytest.mark.parametrize("value, expected", [(0, 0), (6, 6), ("Tue", 1), ("sunday", 6)])
+def test_parse_weekday(value, expected):
+    assert parse_weekday(value) == expected
+
+
+@pytest.mark.parametrize("value", [7, -1, True, "mo", "funday", None])
+def test_parse_weekday_rejects(value):
+    with pytest.raises(ValueError):
+        parse_weekday(value)
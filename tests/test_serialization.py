@@ -0,0 +1,75 @@
+import datetime
+import decimal
+import gzip
+
+import pytest
+
+import serialization
+from serialization import compress, dumps, format_timedelta, loads, negotiate_encoding
+
+
+@pytest.fixture
+def no_brotli(monkeypatch):
+    monkeypatch.setattr(serialization, "brotli", None)
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("GZIP;q=0.5", "gzip"),
+    ("gzip;q=0", None),
+    ("*", "gzip"),
+    ("*;q=0", None),
+    ("gzip;q=0, *", None),
+    ("*, gzip;q=0", None),
+    ("gzip;q=bogus", None),
+])
+def test_negotiate_gzip_only(no_brotli, header, expected):
+    assert negotiate_encoding(header) == expected
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, br", "br"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("*", "br"),
+    ("br;q=0, *", "gzip"),
+    ("br;q=0, gzip;q=0, *", None),
+])
+def test_negotiate_prefers_brotli(monkeypatch, header, expected):
+    # Negotiation only checks that brotli is importable
+    monkeypatch.setattr(serialization, "brotli", serialization.brotli or object())
+    assert negotiate_encoding(header) == expected
+
+
+def test_gzip_round_trip():
+    body = dumps({"rows": list(range(100))})
+    assert gzip.decompress(compress(body, "gzip")) == body
+
+
+def test_compress_rejects_unknown_coding():
+    with pytest.raises(ValueError):
+        compress(b"{}", "deflate")
+
+
+def test_dumps_mysql_row_types():
+    row = {
+        "date": datetime.date(2026, 3, 2),
+        "at": datetime.datetime(2026, 3, 2, 9, 30),
+        "start_time": datetime.timedelta(hours=9, minutes=5),
+        "score": decimal.Decimal("12.5"),
+        "token": b"abc"
+    }
+    assert loads(dumps(row)) == {
+        "date": "2026-03-02",
+        "at": "2026-03-02T09:30:00",
+        "start_time": "09:05:00",
+        "score": 12.5,
+        "token": "abc"
+    }
+
+
+def test_format_negative_and_long_timedeltas():
+    assert format_timedelta(datetime.timedelta(hours=30, seconds=7)) == "30:00:07"
+    assert format_timedelta(-datetime.timedelta(minutes=90)) == "-01:30:00"
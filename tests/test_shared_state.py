@@ -0,0 +1,223 @@
+import datetime
+import decimal
+import threading
+import time
+
+import pytest
+
+import shared_state
+from shared_state import RespBackend, SharedCache, SharedMemoryBackend, StandInServer
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def shm_path(tmp_path):
+    return str(tmp_path / "segment")
+
+
+@pytest.fixture
+def stand_in():
+    server = StandInServer(("127.0.0.1", 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address
+    server.shutdown()
+    server.server_close()
+
+
+# Shared memory hash table
+
+def test_shm_set_get_delete(shm_path):
+    backend = SharedMemoryBackend(shm_path, slots=64, slot_size=256)
+    try:
+        assert backend.get("missing") is None
+        assert backend.set("key", b"value")
+        assert backend.get("key") == b"value"
+        assert backend.set("key", b"other")
+        assert backend.get("key") == b"other"
+        backend.delete("key")
+        assert backend.get("key") is None
+    finally:
+        backend.close()
+
+
+def test_shm_expiry_and_only_if_absent(shm_path):
+    backend = SharedMemoryBackend(shm_path, slots=64, slot_size=256)
+    try:
+        assert backend.set("key", b"first", ttl=0.05, only_if_absent=True)
+        assert not backend.set("key", b"second", only_if_absent=True)
+        time.sleep(0.1)
+        assert backend.get("key") is None
+        assert backend.set("key", b"second", only_if_absent=True)
+        assert backend.get("key") == b"second"
+    finally:
+        backend.close()
+
+
+def test_shm_refuses_oversized_values(shm_path):
+    backend = SharedMemoryBackend(shm_path, slots=64, slot_size=128)
+    try:
+        assert not backend.set("key", b"x" * 200)
+        assert backend.get("key") is None
+    finally:
+        backend.close()
+
+
+def test_shm_probing_keeps_colliding_keys_apart(shm_path):
+    backend = SharedMemoryBackend(shm_path, slots=16, slot_size=128)
+    try:
+        stored = [key for key in (f"key-{i}" for i in range(12)) if backend.set(key, key.encode())]
+        assert len(stored) >= 8
+        for key in stored:
+            assert backend.get(key) == key.encode()
+        # Deleting one key must not hide keys probed past its slot
+        backend.delete(stored[0])
+        for key in stored[1:]:
+            assert backend.get(key) == key.encode()
+    finally:
+        backend.close()
+
+
+def test_shm_is_shared_between_mappings(shm_path):
+    first = SharedMemoryBackend(shm_path, slots=64, slot_size=256)
+    second = SharedMemoryBackend(shm_path)
+    try:
+        first.set("key", b"value")
+        assert second.get("key") == b"value"
+        assert second.slots == 64
+    finally:
+        first.close()
+        second.close()
+
+
+def test_shm_ring_delivers_messages(shm_path):
+    publisher = SharedMemoryBackend(shm_path, slots=64, slot_size=256, ring_slots=8)
+    subscriber = SharedMemoryBackend(shm_path)
+    received = []
+    try:
+        subscriber.subscribe("channel", received.append)
+        subscriber.subscribe("other", lambda message: received.append(("other", message)))
+        time.sleep(0.05)
+        publisher.publish("channel", "hello")
+        publisher.publish("channel", "world")
+        assert wait_for(lambda: received == ["hello", "world"])
+    finally:
+        publisher.close()
+        subscriber.close()
+
+
+def test_shm_ring_overrun_flushes_subscribers(shm_path):
+    publisher = SharedMemoryBackend(shm_path, slots=64, slot_size=256, ring_slots=4)
+    subscriber = SharedMemoryBackend(shm_path, poll_interval=0.2)
+    received = []
+    try:
+        subscriber.subscribe("channel", received.append)
+        time.sleep(0.05)
+        for i in range(20):
+            publisher.publish("channel", str(i))
+        assert wait_for(lambda: shared_state.FLUSH in received)
+    finally:
+        publisher.close()
+        subscriber.close()
+
+
+# Redis-protocol backend against the stand-in server
+
+def test_resp_commands(stand_in):
+    host, port = stand_in
+    backend = RespBackend(host, port)
+    try:
+        assert backend.get("key") is None
+        assert backend.set("key", b"value")
+        assert backend.get("key") == b"value"
+        assert not backend.set("key", b"other", only_if_absent=True)
+        assert backend.set("short", b"value", ttl=0.05)
+        time.sleep(0.1)
+        assert backend.get("short") is None
+        backend.delete("key")
+        assert backend.get("key") is None
+    finally:
+        backend.close()
+
+
+def test_resp_invalidation_reaches_other_workers(stand_in):
+    host, port = stand_in
+    first, second = RespBackend(host, port), RespBackend(host, port)
+    try:
+        writer = SharedCache(first, "users", 60)
+        reader = SharedCache(second, "users", 60)
+        time.sleep(0.1)
+        writer.set(1, {"name": "old"})
+        assert reader.get(1) == {"name": "old"}
+        writer.set(1, {"name": "new"})
+        assert wait_for(lambda: reader.get(1) == {"name": "new"})
+        writer.invalidate(1)
+        assert wait_for(lambda: reader.get(1) is None)
+    finally:
+        first.close()
+        second.close()
+
+
+# SharedCache
+
+def test_cache_round_trips_database_types():
+    cache = SharedCache(shared_state.MemoryBackend(), "rows", 60)
+    row = {
+        "created_at": datetime.datetime(2026, 10, 19, 9, 30, 15),
+        "date": datetime.date(2026, 10, 19),
+        "start_time": datetime.timedelta(hours=9, minutes=30),
+        "average": decimal.Decimal("12.50"),
+        "token": b"\x00\xff",
+        "pair": (1, "a"),
+        "nested": [{"expires_at": datetime.datetime(2026, 10, 19, 10, 0)}],
+        "flag": True,
+        "missing": None
+    }
+    cache.set("row", row)
+    assert cache.get("row") == row
+
+
+def test_cache_never_unpickles():
+    backend = shared_state.MemoryBackend()
+    cache = SharedCache(backend, "rows", 60)
+    backend.set("rows:evil", b"\x80\x04\x95\x00\x00\x00\x00\x00\x00\x00\x00.")
+    assert cache.get("evil") is None
+
+
+def test_cache_drops_old_value_when_new_one_is_refused(shm_path):
+    backend = SharedMemoryBackend(shm_path, slots=64, slot_size=256)
+    try:
+        cache = SharedCache(backend, "courses", 60)
+        cache.set("1", "old")
+        cache.set("1", "x" * 1000)
+        assert cache.get("1") is None
+        assert SharedCache(SharedMemoryBackend(shm_path), "courses", 60).get("1") is None
+    finally:
+        backend.close()
+
+
+def test_cache_fails_open_when_server_is_unreachable(stand_in):
+    host, port = stand_in
+    backend = RespBackend(host, port)
+    cache = SharedCache(backend, "users", 60)
+    unreachable = RespBackend("127.0.0.1", 1)
+    down = SharedCache(unreachable, "users", 60)
+    try:
+        assert down.get(1) is None
+        down.set(1, {"name": "x"})
+        down.invalidate(1)
+        assert down.get(1) is None
+        # A healthy cache is unaffected
+        cache.set(1, {"name": "y"})
+        assert cache.get(1) == {"name": "y"}
+    finally:
+        backend.close()
+        unreachable.close()